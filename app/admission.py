@@ -0,0 +1,199 @@
+# admission.py
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from app.monitoring import BACKGROUND, mongo_latency, route_class_var
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADAPT_INTERVAL_SECONDS = 1.0    # How often a pool may move its limit
+TIMING_ALPHA = 0.2              # Weight of the newest sample in wait/service averages
+# A pool backs off when its route class's Mongo latency exceeds this multiple
+# of that class's baseline (ADMISSION_<CLASS>_TARGET_LATENCY_MS pins a fixed
+# target instead), never below the floor.
+ADMISSION_LATENCY_TOLERANCE = float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "2.0"))
+ADMISSION_MIN_TARGET_LATENCY_MS = float(os.getenv("ADMISSION_MIN_TARGET_LATENCY_MS", "5"))
+
+# Per route class: starting/min/max concurrency, queue length and queue deadline.
+POOL_SETTINGS = {
+    "money": {"limit": 64, "min_limit": 16, "max_limit": 256, "max_queue": 256, "queue_timeout": 2.0},
+    "reads": {"limit": 64, "min_limit": 8, "max_limit": 256, "max_queue": 128, "queue_timeout": 1.0},
+    "admin": {"limit": 4, "min_limit": 1, "max_limit": 16, "max_queue": 8, "queue_timeout": 5.0},
+    "auth": {"limit": 32, "min_limit": 8, "max_limit": 128, "max_queue": 128, "queue_timeout": 2.0},
+}
+
+
+def _fixed_target_ms(route_class: str) -> Optional[float]:
+    value = os.getenv(f"ADMISSION_{route_class.upper()}_TARGET_LATENCY_MS")
+    return float(value) if value else None
+
+# (method or None for any, path prefix, class); first match wins, default "reads".
+ROUTE_CLASSES = [
+    ("POST", "/transactions/pending/bulk", "admin"),
+    ("POST", "/transactions/deposit", "money"),
+    ("POST", "/transactions/withdraw", "money"),
+    ("POST", "/transactions/transfer", "money"),
+    ("POST", "/transactions/pending/", "money"),
+    ("POST", "/bank/create-account", "money"),
+    ("POST", "/bank/hot-accounts/", "admin"),
+    (None, "/transactions/all-transactions", "admin"),
+    (None, "/transactions/pending", "admin"),
+    (None, "/transactions/processing", "admin"),
+    (None, "/users/audit-logs", "admin"),
+    (None, "/users/bulk-import", "admin"),
+    (None, "/users/login", "auth"),
+    (None, "/users/register", "auth"),
+]
+
+
+def classify_route(method: str, path: str) -> str:
+    for route_method, prefix, route_class in ROUTE_CLASSES:
+        if (route_method is None or route_method == method) and path.startswith(prefix):
+            return route_class
+    return "reads"
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+
+
+class AdmissionPool:
+    """
+    Concurrency limit with a bounded FIFO queue. Requests over the limit wait
+    up to `queue_timeout` seconds; when the queue is full or the deadline
+    passes they are shed. The limit moves additively up while the Mongo
+    latency of this pool's own requests is under target and multiplicatively
+    down when it is over (AIMD).
+    """
+
+    def __init__(self, name: str, limit: int, min_limit: int, max_limit: int,
+                 max_queue: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.fixed_target_ms = _fixed_target_ms(name)
+        self.in_flight = 0
+        self._waiters = deque()
+        self._last_adapt = time.monotonic()
+        self.stats = {"admitted": 0, "rejected_queue_full": 0, "rejected_deadline": 0,
+                      "queue_wait_ms": 0.0, "service_ms": 0.0}
+
+    def _retry_after(self) -> int:
+        # Rough time for the current queue to drain at the observed service time.
+        per_slot_seconds = max(self.stats["service_ms"], 1.0) / 1000
+        return max(1, math.ceil(len(self._waiters) * per_slot_seconds / max(self.limit, 1)))
+
+    async def acquire(self) -> float:
+        """Wait for a slot; returns queue wait in milliseconds or raises Overloaded."""
+        started = time.monotonic()
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            return 0.0
+        if len(self._waiters) >= self.max_queue:
+            self.stats["rejected_queue_full"] += 1
+            raise Overloaded(self._retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["rejected_deadline"] += 1
+            raise Overloaded(self._retry_after())
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        # release() already took the slot (in_flight) on our behalf.
+        self.stats["admitted"] += 1
+        return (time.monotonic() - started) * 1000
+
+    def release(self, service_ms: float):
+        self.in_flight -= 1
+        self.stats["service_ms"] += TIMING_ALPHA * (service_ms - self.stats["service_ms"])
+        self._adapt()
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def record_wait(self, wait_ms: float):
+        self.stats["queue_wait_ms"] += TIMING_ALPHA * (wait_ms - self.stats["queue_wait_ms"])
+
+    def target_latency_ms(self) -> Optional[float]:
+        if self.fixed_target_ms is not None:
+            return self.fixed_target_ms
+        latency = mongo_latency.for_class(self.name)
+        if latency is None or latency.samples == 0:
+            return None
+        return max(ADMISSION_MIN_TARGET_LATENCY_MS, latency.baseline_ms * ADMISSION_LATENCY_TOLERANCE)
+
+    def _adapt(self):
+        now = time.monotonic()
+        latency = mongo_latency.for_class(self.name)
+        if now - self._last_adapt < ADAPT_INTERVAL_SECONDS or latency is None or latency.samples == 0:
+            return
+        self._last_adapt = now
+        if latency.ewma_ms > self.target_latency_ms():
+            self.limit = max(self.min_limit, int(self.limit * 0.9))
+        else:
+            self.limit = min(self.max_limit, self.limit + 1)
+
+    def snapshot(self) -> Dict:
+        latency = mongo_latency.for_class(self.name)
+        target = self.target_latency_ms()
+        return {"limit": self.limit, "in_flight": self.in_flight, "queued": len(self._waiters), **self.stats,
+                "mongo": latency.snapshot() if latency else None,
+                "target_latency_ms": round(target, 2) if target is not None else None}
+
+
+class AdmissionController:
+    def __init__(self, settings: Dict[str, Dict]):
+        self.pools = {name: AdmissionPool(name, **options) for name, options in settings.items()}
+
+    async def handle(self, request: Request, call_next):
+        pool = self.pools[classify_route(request.method, request.url.path)]
+        try:
+            wait_ms = await pool.acquire()
+        except Overloaded as exc:
+            return JSONResponse(
+                status_code=503,
+                content={"detail": "Server busy, please retry later"},
+                headers={"Retry-After": str(exc.retry_after)}
+            )
+        pool.record_wait(wait_ms)
+
+        started = time.monotonic()
+        # Tags this request's Mongo commands with its route class.
+        token = route_class_var.set(pool.name)
+        try:
+            response = await call_next(request)
+        finally:
+            route_class_var.reset(token)
+            service_ms = (time.monotonic() - started) * 1000
+            pool.release(service_ms)
+        # Queue wait and service time are reported separately.
+        response.headers["Server-Timing"] = f"queue;dur={wait_ms:.1f}, service;dur={service_ms:.1f}"
+        return response
+
+    def stats(self) -> Dict:
+        background = mongo_latency.for_class(BACKGROUND)
+        return {
+            "mongo_latency_ms": round(mongo_latency.overall.ewma_ms, 2),
+            "background_mongo": background.snapshot() if background else None,
+            "pools": {name: pool.snapshot() for name, pool in self.pools.items()}
+        }
+
+
+admission_controller = AdmissionController(POOL_SETTINGS)
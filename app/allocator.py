@@ -0,0 +1,79 @@
+# allocator.py
+import asyncio
+import os
+
+from pymongo import ReturnDocument
+
+from app.config import db
+
+ACCOUNT_NUMBER_BLOCK_SIZE = int(os.getenv("ACCOUNT_NUMBER_BLOCK_SIZE", "1000"))  # Numbers reserved per DB hit
+ACCOUNT_NUMBER_BASE = 1000000000   # Sequence offset so every body has 10 digits
+COUNTER_ID = "account_number"
+
+# New account numbers are a 10-digit sequence body plus a Luhn check digit
+# (11 digits). Legacy numbers are 10 random digits with no check digit.
+LEGACY_ACCOUNT_NUMBER_LENGTH = 10
+ACCOUNT_NUMBER_LENGTH = 11
+
+
+def luhn_check_digit(body: str) -> str:
+    total = 0
+    # Double every second digit starting from the rightmost digit of the body.
+    for index, char in enumerate(reversed(body)):
+        digit = int(char)
+        if index % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return str((10 - total % 10) % 10)
+
+
+def is_valid_account_number(account_number: str) -> bool:
+    """
+    Cheap format check for account numbers, so malformed or mistyped numbers
+    can be rejected without a database lookup.
+    """
+    if not account_number or not account_number.isdigit():
+        return False
+    if len(account_number) == LEGACY_ACCOUNT_NUMBER_LENGTH:
+        return True
+    if len(account_number) == ACCOUNT_NUMBER_LENGTH:
+        return luhn_check_digit(account_number[:-1]) == account_number[-1]
+    return False
+
+
+class AccountNumberAllocator:
+    """
+    Hands out unique account numbers from blocks reserved on the shared
+    counter document with one $inc per block. Numbers within a block are
+    handed out locally with no DB hit. Unused numbers in a block are lost
+    when the process exits, which only leaves gaps.
+    """
+
+    def __init__(self, block_size: int = ACCOUNT_NUMBER_BLOCK_SIZE):
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def _reserve_block(self):
+        counter = await db.counters.find_one_and_update(
+            {"_id": COUNTER_ID},
+            {"$inc": {"seq": self.block_size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._end = counter["seq"]
+        self._next = self._end - self.block_size
+
+    async def next_account_number(self) -> str:
+        async with self._lock:
+            if self._next >= self._end:
+                await self._reserve_block()
+            body = str(ACCOUNT_NUMBER_BASE + self._next)
+            self._next += 1
+        return body + luhn_check_digit(body)
+
+
+account_number_allocator = AccountNumberAllocator()
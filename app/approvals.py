@@ -0,0 +1,310 @@
+# approvals.py
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument, UpdateOne
+
+from app.config import db
+from app.utils import build_audit_entry, AUDIT_COLLECTION
+from app.query_cache import bump_history_version, bump_history_versions
+from app.hot_accounts import credit_account
+from app.queries import claimed_filter, pending_filter
+
+BULK_APPROVAL_CONCURRENCY = int(os.getenv("BULK_APPROVAL_CONCURRENCY", "32"))  # Approvals in flight at once
+BULK_WRITE_BATCH_SIZE = int(os.getenv("BULK_WRITE_BATCH_SIZE", "500"))         # Items per status bulk_write
+STUCK_CLAIM_SECONDS = int(os.getenv("STUCK_CLAIM_SECONDS", "600"))             # Claims idle this long were abandoned by a crash
+
+# Items in "processing" carry the claim_id of the job or single approval that
+# claimed them. Right before funds move, an item is stamped funds_moving_at,
+# so an item a crashed claim left behind without the stamp never had funds
+# moved and can go back to "pending"; one with it needs an admin to check
+# the accounts and settle it (see list_stuck_claims).
+
+
+async def create_bulk_job(requested_by: str, params: Dict) -> str:
+    job = {
+        "status": "queued",
+        "requested_by": requested_by,
+        "params": params,
+        "created_at": datetime.utcnow(),
+        "total": 0,
+        "processed": 0,
+        "counts": {"success": 0, "failed": 0, "rejected": 0, "invalid": 0},
+        "outcomes": []
+    }
+    result = await db.bulk_jobs.insert_one(job)
+    return str(result.inserted_id)
+
+
+async def get_bulk_job(job_id: str) -> Optional[Dict]:
+    try:
+        job = await db.bulk_jobs.find_one({"_id": ObjectId(job_id)})
+    except InvalidId:
+        return None
+    if job:
+        job["_id"] = str(job["_id"])
+    return job
+
+
+async def _claim_pending(claim_id: str, params: Dict) -> (List[Dict], List[Dict]):
+    """
+    Atomically move matching items from "pending" to "processing" under
+    `claim_id`, so concurrent jobs and single approvals (claim_pending_transaction)
+    never act on the same item. Returns (claimed transactions, outcomes for ids that were rejected
+    up front).
+    """
+    invalid = []
+    object_ids = None
+    if params.get("txn_ids"):
+        object_ids = []
+        for txn_id in params["txn_ids"]:
+            try:
+                object_ids.append(ObjectId(txn_id))
+            except InvalidId:
+                invalid.append({"txn_id": txn_id, "status": "invalid", "detail": "Invalid transaction id"})
+    query = pending_filter(object_ids, params.get("txn_type"), params.get("user_id"), params.get("before"))
+
+    candidates = db.transactions.find(query, {"_id": 1})
+    if not params.get("txn_ids"):
+        # Explicit ids are claimed in full (the route caps them at `limit`)
+        candidates = candidates.limit(params["limit"])
+    candidates = await candidates.to_list(length=None)
+    await db.transactions.update_many(
+        {"_id": {"$in": [c["_id"] for c in candidates]}, "status": "pending"},
+        {"$set": {"status": "processing", "claim_id": claim_id, "updated_at": datetime.utcnow()}}
+    )
+    claimed = await db.transactions.find(claimed_filter(claim_id)).to_list(length=None)
+    if claimed:
+        await bump_history_versions(txn["user_id"] for txn in claimed)
+
+    if params.get("txn_ids"):
+        claimed_ids = {str(txn["_id"]) for txn in claimed}
+        for object_id in query["_id"]["$in"]:
+            if str(object_id) not in claimed_ids:
+                invalid.append({"txn_id": str(object_id), "status": "invalid", "detail": "Pending transaction not found"})
+    return claimed, invalid
+
+
+async def claim_pending_transaction(txn_id: ObjectId, claim_id: str) -> Optional[Dict]:
+    """
+    Claim one pending item (pending -> processing) for a single approval, the
+    same transition bulk jobs make. Returns None if it is no longer pending.
+    """
+    return await db.transactions.find_one_and_update(
+        {"_id": txn_id, "status": "pending"},
+        {"$set": {"status": "processing", "claim_id": claim_id, "updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def mark_funds_moving(txn_ids: List[ObjectId], claim_id: str):
+    """Record that funds are about to move for these claimed items."""
+    await db.transactions.update_many(
+        {"_id": {"$in": txn_ids}, "claim_id": claim_id, "status": "processing"},
+        {"$set": {"funds_moving_at": datetime.utcnow()}}
+    )
+
+
+async def settle_claimed(txn: Dict, claim_id: str, status: str):
+    """Set the final status of an item claimed under `claim_id`."""
+    await db.transactions.update_one(
+        {"_id": txn["_id"], "claim_id": claim_id},
+        {"$set": {"status": status, "updated_at": datetime.utcnow()}, "$unset": {"claim_id": "", "funds_moving_at": ""}}
+    )
+    await bump_history_version(txn["user_id"])
+
+
+async def approve_claimed(txn: Dict) -> (str, str):
+    """
+    Move the funds for one claimed transaction. The balance check and debit
+    are a single conditional $inc instead of find_one + $inc.
+    """
+    amount = txn["amount"]
+    user_id = txn["user_id"]
+    if txn["type"] not in ["withdraw", "transfer"]:
+        return "failed", "Unsupported transaction type for approval"
+
+    debit_result = await db.accounts.update_one(
+        {"user_id": user_id, "balance": {"$gte": amount}},
+        {"$inc": {"balance": -amount}}
+    )
+    if debit_result.modified_count == 0:
+        return "failed", "Insufficient funds at approval time"
+    if txn["type"] == "withdraw":
+        return "success", "Withdrawal approved and funds deducted"
+
+    credited = await credit_account(txn.get("to_account"), amount, str(txn["_id"]))
+    if not credited:
+        # Rollback debit
+        await db.accounts.update_one({"user_id": user_id}, {"$inc": {"balance": amount}})
+        return "failed", "Failed to credit recipient on approval"
+    return "success", "Transfer approved; funds debited and credited"
+
+
+async def _process_batch(job_id: str, action: str, batch: List[Dict],
+                         semaphore: asyncio.Semaphore, ip_address: Optional[str]) -> List[Dict]:
+    async def run_one(txn):
+        if action == "reject":
+            return "rejected", "Transaction rejected"
+        async with semaphore:
+            return await approve_claimed(txn)
+
+    if action == "approve":
+        await mark_funds_moving([txn["_id"] for txn in batch], job_id)
+    results = await asyncio.gather(*[run_one(txn) for txn in batch])
+
+    now = datetime.utcnow()
+    status_updates = []
+    audit_entries = []
+    outcomes = []
+    for txn, (outcome, detail) in zip(batch, results):
+        final_status = "success" if outcome == "success" else "failed"
+        status_updates.append(UpdateOne(
+            {"_id": txn["_id"], "claim_id": job_id},
+            {"$set": {"status": final_status, "updated_at": now}, "$unset": {"claim_id": "", "funds_moving_at": ""}}
+        ))
+        if outcome == "rejected":
+            audit_action = "pending_rejected"
+        elif outcome == "success":
+            audit_action = f"pending_{txn['type']}_approved"
+        else:
+            audit_action = f"pending_{txn['type']}_failed"
+        audit_entries.append(build_audit_entry(
+            txn["user_id"], audit_action, ip_address, {"txn_id": str(txn["_id"]), "bulk_job_id": job_id}
+        ))
+        outcomes.append({"txn_id": str(txn["_id"]), "status": outcome, "detail": detail})
+
+    await db.transactions.bulk_write(status_updates, ordered=False)
+    await bump_history_versions(txn["user_id"] for txn in batch)
+    await db[AUDIT_COLLECTION].insert_many(audit_entries, ordered=False)
+    return outcomes
+
+
+async def _record_progress(job_id: str, outcomes: List[Dict]):
+    counts = {}
+    for outcome in outcomes:
+        counts[f"counts.{outcome['status']}"] = counts.get(f"counts.{outcome['status']}", 0) + 1
+    await db.bulk_jobs.update_one(
+        {"_id": ObjectId(job_id)},
+        {"$inc": {"processed": len(outcomes), **counts}, "$push": {"outcomes": {"$each": outcomes}},
+         "$set": {"heartbeat_at": datetime.utcnow()}}
+    )
+
+
+async def run_bulk_job(job_id: str, ip_address: Optional[str] = None) -> Dict:
+    """
+    Claim the job's pending items (the job id doubles as the claim id) and
+    approve or reject them. Account updates run under a bounded semaphore;
+    status updates and audit entries are written with one bulk_write /
+    insert_many per batch, after which the job's progress counters are updated.
+
+    A crash mid-job leaves items in "processing". They are not released
+    automatically because funds may already have moved for some of them;
+    list_stuck_claims, release_stuck_claims and resolve_stuck_claim let an
+    admin recover them.
+    """
+    now = datetime.utcnow()
+    job = await db.bulk_jobs.find_one_and_update(
+        {"_id": ObjectId(job_id), "status": "queued"},
+        {"$set": {"status": "running", "started_at": now, "heartbeat_at": now}}
+    )
+    if not job:
+        return await get_bulk_job(job_id)
+
+    params = job["params"]
+    claimed, invalid = await _claim_pending(job_id, params)
+    await db.bulk_jobs.update_one({"_id": ObjectId(job_id)}, {"$set": {"total": len(claimed) + len(invalid)}})
+    if invalid:
+        await _record_progress(job_id, invalid)
+
+    semaphore = asyncio.Semaphore(BULK_APPROVAL_CONCURRENCY)
+    try:
+        for i in range(0, len(claimed), BULK_WRITE_BATCH_SIZE):
+            batch = claimed[i:i + BULK_WRITE_BATCH_SIZE]
+            outcomes = await _process_batch(job_id, params["action"], batch, semaphore, ip_address)
+            await _record_progress(job_id, outcomes)
+    except Exception as exc:
+        await db.bulk_jobs.update_one(
+            {"_id": ObjectId(job_id)},
+            {"$set": {"status": "failed", "error": str(exc), "finished_at": datetime.utcnow()}}
+        )
+        raise
+
+    await db.bulk_jobs.update_one(
+        {"_id": ObjectId(job_id)},
+        {"$set": {"status": "completed", "finished_at": datetime.utcnow()}}
+    )
+    return await get_bulk_job(job_id)
+
+
+
+async def _live_jobs(claim_ids: List[str]) -> set:
+    """Claim ids that belong to a bulk job that is still reporting progress."""
+    cutoff = datetime.utcnow() - timedelta(seconds=STUCK_CLAIM_SECONDS)
+    job_ids = []
+    for claim_id in claim_ids:
+        try:
+            job_ids.append(ObjectId(claim_id))
+        except InvalidId:
+            pass
+    jobs = await db.bulk_jobs.find(
+        {"_id": {"$in": job_ids}, "status": "running", "heartbeat_at": {"$gte": cutoff}}, {"_id": 1}
+    ).to_list(length=None)
+    return {str(job["_id"]) for job in jobs}
+
+
+async def list_stuck_claims(claim_id: Optional[str] = None) -> List[Dict]:
+    """
+    Items left in "processing" by a claim that is no longer running: claimed
+    more than STUCK_CLAIM_SECONDS ago by a single approval, or by a bulk job
+    that finished, failed or stopped reporting progress. Filter by
+    `claim_id` (a bulk job's id) to see one job's leftovers.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=STUCK_CLAIM_SECONDS)
+    query = {"claim_id": claim_id or {"$exists": True}, "status": "processing", "updated_at": {"$lt": cutoff}}
+    items = await db.transactions.find(query).to_list(length=None)
+    live = await _live_jobs(list({txn["claim_id"] for txn in items}))
+    stuck = [txn for txn in items if txn["claim_id"] not in live]
+    for txn in stuck:
+        txn["funds_may_have_moved"] = "funds_moving_at" in txn
+    return stuck
+
+
+async def release_stuck_claims(claim_id: str) -> int:
+    """
+    Put a stuck claim's items whose funds never started moving back to
+    "pending", so they can be approved again. Returns the number released.
+    """
+    stuck = [txn for txn in await list_stuck_claims(claim_id) if not txn["funds_may_have_moved"]]
+    if not stuck:
+        return 0
+    result = await db.transactions.update_many(
+        {"_id": {"$in": [txn["_id"] for txn in stuck]}, "claim_id": claim_id,
+         "status": "processing", "funds_moving_at": {"$exists": False}},
+        {"$set": {"status": "pending", "updated_at": datetime.utcnow()}, "$unset": {"claim_id": ""}}
+    )
+    await bump_history_versions(txn["user_id"] for txn in stuck)
+    return result.modified_count
+
+
+async def resolve_stuck_claim(txn_id: ObjectId, status: str) -> Optional[Dict]:
+    """
+    Settle one stuck item as "success" or "failed" once an admin has checked
+    whether its funds moved. Returns the item, or None if it is not stuck.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=STUCK_CLAIM_SECONDS)
+    stuck = await db.transactions.find_one({"_id": txn_id, "status": "processing", "updated_at": {"$lt": cutoff}})
+    if not stuck or stuck.get("claim_id") in await _live_jobs([stuck.get("claim_id")]):
+        return None
+    result = await db.transactions.update_one(
+        {"_id": txn_id, "claim_id": stuck.get("claim_id"), "status": "processing"},
+        {"$set": {"status": status, "updated_at": datetime.utcnow()}, "$unset": {"claim_id": "", "funds_moving_at": ""}}
+    )
+    if result.modified_count == 0:
+        return None
+    await bump_history_version(stuck["user_id"])
+    return stuck
@@ -0,0 +1,226 @@
+# archive.py
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.config import db, db_jobs
+from app.indexes import ARCHIVE_INDEXES
+from app.queries import archivable_filter
+
+ARCHIVE_HORIZON_DAYS = int(os.getenv("ARCHIVE_HORIZON_DAYS", "90"))   # Older transactions leave the hot tier
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))     # Documents moved per round
+ARCHIVE_CATALOG_TTL_SECONDS = 60                                      # In-process cache of the catalog
+CATALOG_CLOCK_SKEW_SECONDS = 5                                        # Slack when waiting out other processes' caches
+
+ARCHIVE_PREFIX = "transactions_archive_"
+
+_catalog_cache = {"loaded_at": 0.0, "entries": []}
+
+
+def archive_collection_name(timestamp: datetime) -> str:
+    return f"{ARCHIVE_PREFIX}{timestamp.year:04d}_{timestamp.month:02d}"
+
+
+def _month_start(timestamp: datetime) -> datetime:
+    return timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month_start(timestamp: datetime) -> datetime:
+    start = _month_start(timestamp)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+async def _archive_catalog() -> List[Dict]:
+    """Archived months, oldest first: {"_id": collection name, "month_start", "month_end", "settled_until"}."""
+    if time.monotonic() - _catalog_cache["loaded_at"] > ARCHIVE_CATALOG_TTL_SECONDS:
+        _catalog_cache["entries"] = await db.archive_catalog.find().sort("month_start", 1).to_list(length=None)
+        _catalog_cache["loaded_at"] = time.monotonic()
+    return _catalog_cache["entries"]
+
+
+def settlement_time(txn: Dict) -> datetime:
+    """When a transaction's funds moved: approval time for approved pending items."""
+    return txn.get("updated_at") or txn["timestamp"]
+
+
+async def collections_for_range(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                database=None, by_settlement: bool = False) -> List:
+    """
+    Transaction collections that may hold documents with timestamps in
+    [start, end]: archived months overlapping the range, then the hot tier.
+    With `by_settlement` the range is on settlement time instead; a month
+    can hold items requested in it but approved much later, so it is kept
+    until its settled_until. `database` picks the handle to read through
+    (default: primary).
+    """
+    database = database if database is not None else db
+    collections = []
+    for entry in await _archive_catalog():
+        if start and by_settlement:
+            # Entries without settled_until predate it and are always searched.
+            if entry.get("settled_until") and entry["settled_until"] <= start:
+                continue
+        elif start and entry["month_end"] <= start:
+            continue
+        # Settlement never precedes the request, so the end bound prunes both ways.
+        if end and entry["month_start"] > end:
+            continue
+        collections.append(database[entry["_id"]])
+    collections.append(database.transactions)
+    return collections
+
+
+def _timestamp_bounds(query: Dict) -> (Optional[datetime], Optional[datetime]):
+    timestamp_filter = query.get("timestamp")
+    if not isinstance(timestamp_filter, dict):
+        return None, None
+    start = timestamp_filter.get("$gte") or timestamp_filter.get("$gt")
+    end = timestamp_filter.get("$lte") or timestamp_filter.get("$lt")
+    return start, end
+
+
+async def find_transactions(query: Dict, database=None) -> List[Dict]:
+    """
+    Run a transactions query against the hot tier and every archived month
+    its timestamp range overlaps, concurrently. Results are ordered by
+    timestamp. A document caught mid-move can be in two tiers for a moment,
+    so results are de-duplicated by _id.
+    """
+    start, end = _timestamp_bounds(query)
+    collections = await collections_for_range(start, end, database)
+    results = await asyncio.gather(*[c.find(query).to_list(length=None) for c in collections])
+
+    seen = set()
+    transactions = []
+    for tier in results:
+        for txn in tier:
+            if txn["_id"] not in seen:
+                seen.add(txn["_id"])
+                transactions.append(txn)
+    transactions.sort(key=lambda txn: txn.get("timestamp") or datetime.min)
+    return transactions
+
+
+async def _months_to_archive(query: Dict, cutoff: datetime) -> List[datetime]:
+    """Start of every month holding at least one document matching `query`."""
+    oldest = await db_jobs.transactions.find_one(query, {"timestamp": 1}, sort=[("timestamp", 1)])
+    months = []
+    month_start = _month_start(oldest["timestamp"]) if oldest else cutoff
+    while month_start < cutoff:
+        month_end = _next_month_start(month_start)
+        in_month = {**query, "timestamp": {"$gte": month_start, "$lt": min(month_end, cutoff)}}
+        if await db_jobs.transactions.find_one(in_month, {"_id": 1}):
+            months.append(month_start)
+        month_start = month_end
+    return months
+
+
+async def _register_month(month_start: datetime, settled_until: datetime) -> Optional[datetime]:
+    """
+    Register the month in the catalog (creating its collection's indexes) or
+    raise its settled_until. Returns when the entry last changed in a way
+    readers must see before rows leave the hot tier (None for entries that
+    predate changed_at).
+    """
+    name = archive_collection_name(month_start)
+    entry = await db_jobs.archive_catalog.find_one({"_id": name})
+    if not entry:
+        await db_jobs[name].create_indexes(ARCHIVE_INDEXES)
+    if not entry or not entry.get("settled_until") or settled_until > entry["settled_until"]:
+        update = {"$max": {"settled_until": settled_until}}
+        # Readers prune on settled_until, so raising it is a change they must
+        # see, as is a new month. Filling it in on an older entry is not.
+        if not entry or entry.get("settled_until"):
+            update["$set"] = {"changed_at": datetime.utcnow()}
+        if not entry:
+            update["$setOnInsert"] = {"month_start": month_start, "month_end": _next_month_start(month_start)}
+        entry = await db_jobs.archive_catalog.find_one_and_update(
+            {"_id": name}, update, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        _catalog_cache["loaded_at"] = 0.0
+    return entry.get("changed_at")
+
+
+async def _copy_month(name: str, docs: List[Dict]):
+    """Copy `docs` into the month's (already registered) archive collection."""
+    try:
+        await db_jobs[name].insert_many(docs, ordered=False)
+    except BulkWriteError as exc:
+        # Documents copied by an earlier interrupted run are already there.
+        if any(error["code"] != 11000 for error in exc.details["writeErrors"]):
+            raise
+
+
+async def _wait_for_catalog_readers(changed: List[datetime]):
+    """
+    Other processes cache the catalog for up to ARCHIVE_CATALOG_TTL_SECONDS.
+    Rows of a new (or extended) month may only leave the hot tier once every
+    reader's cache has expired and picked the change up.
+    """
+    if not changed:
+        return
+    visible_at = max(changed) + timedelta(seconds=ARCHIVE_CATALOG_TTL_SECONDS + CATALOG_CLOCK_SKEW_SECONDS)
+    remaining = (visible_at - datetime.utcnow()).total_seconds()
+    if remaining > 0:
+        print(f"Waiting {remaining:.0f}s for readers to see newly archived months")
+        await asyncio.sleep(remaining)
+
+
+async def _retain_idempotency_keys(batch: List[Dict]):
+    """
+    Keep the idempotency keys of archived transactions in idempotency_keys,
+    which is never archived, so retries with an old key are still detected
+    (see utils.find_transaction_id_by_idempotency_key). Entries expire
+    IDEMPOTENCY_KEY_RETENTION_DAYS after the transaction.
+    """
+    keyed = [txn for txn in batch if txn.get("idempotency_key")]
+    if not keyed:
+        return
+    await db_jobs.idempotency_keys.bulk_write([
+        UpdateOne(
+            {"_id": txn["idempotency_key"]},
+            {"$setOnInsert": {"txn_id": txn["_id"], "created_at": txn["timestamp"]}},
+            upsert=True
+        )
+        for txn in keyed
+    ], ordered=False)
+
+
+async def archive_transactions(horizon_days: Optional[int] = None) -> Dict:
+    """
+    Move settled transactions older than the horizon from the hot collection
+    into per-month archive collections. Every month the run touches is
+    registered up front with settled_until at the run's start (nothing
+    settled later is moved by this run), and the run waits once for every
+    reader to see the catalog. Batches are then copied (idempotently) and
+    deleted from the hot tier, so readers never miss a document.
+    """
+    started_at = datetime.utcnow()
+    cutoff = started_at - timedelta(days=horizon_days or ARCHIVE_HORIZON_DAYS)
+    query = archivable_filter(cutoff, started_at)
+    month_starts = await _months_to_archive(query, cutoff)
+    changed = [await _register_month(month_start, started_at) for month_start in month_starts]
+    await _wait_for_catalog_readers([ts for ts in changed if ts])
+
+    moved = 0
+    months = set()
+    while True:
+        batch = await db_jobs.transactions.find(query).sort("timestamp", 1).limit(ARCHIVE_BATCH_SIZE).to_list(length=None)
+        if not batch:
+            break
+        by_month = {}
+        for txn in batch:
+            by_month.setdefault(archive_collection_name(txn["timestamp"]), []).append(txn)
+        await asyncio.gather(*[_copy_month(name, docs) for name, docs in by_month.items()])
+        await _retain_idempotency_keys(batch)
+        await db_jobs.transactions.delete_many({"_id": {"$in": [txn["_id"] for txn in batch]}})
+        moved += len(batch)
+        months.update(by_month)
+
+    print(f"Archived {moved} transactions older than {cutoff.isoformat()} into {len(months)} monthly collections")
+    return {"moved": moved, "cutoff": cutoff.isoformat(), "months": sorted(months)}
@@ -0,0 +1,90 @@
+# audit_store.py
+"""
+Time-series storage for audit events, and the migration from the legacy
+audit_logs collection.
+
+Migrate existing entries (resumable; re-run to continue):
+    python -m app.audit_store --migrate [--drop-source]
+"""
+import argparse
+import asyncio
+import os
+
+from pymongo.errors import CollectionInvalid
+
+from app.config import db_jobs
+from app.models import AuditLog
+from app.utils import AUDIT_COLLECTION, audit_to_compact
+
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "365"))   # Events older than this expire
+LEGACY_AUDIT_COLLECTION = "audit_logs"
+MIGRATION_ID = "audit_logs_to_timeseries"
+MIGRATION_BATCH_SIZE = 1000
+
+
+async def ensure_audit_collection():
+    """
+    Create the audit time-series collection (metaField = user_id/action), or
+    apply the current retention if it already exists.
+    """
+    expire_after = AUDIT_RETENTION_DAYS * 24 * 3600
+    try:
+        await db_jobs.create_collection(
+            AUDIT_COLLECTION,
+            timeseries={"timeField": "t", "metaField": "m", "granularity": "seconds"},
+            expireAfterSeconds=expire_after
+        )
+    except CollectionInvalid:
+        await db_jobs.command({"collMod": AUDIT_COLLECTION, "expireAfterSeconds": expire_after})
+
+
+async def migrate_audit_logs(drop_source: bool = False) -> int:
+    """
+    Copy legacy audit_logs documents into the time-series collection in _id
+    order. Time-series inserts cannot be de-duplicated, so progress is
+    checkpointed after every batch; an interrupted run repeats at most the
+    batch that was in flight.
+    """
+    await ensure_audit_collection()
+    checkpoint = await db_jobs.migrations.find_one({"_id": MIGRATION_ID}) or {}
+    query = {"_id": {"$gt": checkpoint["last_id"]}} if checkpoint.get("last_id") else {}
+    migrated = checkpoint.get("migrated", 0)
+
+    while True:
+        batch = await db_jobs[LEGACY_AUDIT_COLLECTION].find(query).sort("_id", 1).limit(MIGRATION_BATCH_SIZE).to_list(length=None)
+        if not batch:
+            break
+        docs = []
+        for legacy in batch:
+            legacy.setdefault("details", {})
+            entry = AuditLog(**{key: value for key, value in legacy.items() if key != "_id"})
+            docs.append(audit_to_compact(entry))
+        await db_jobs[AUDIT_COLLECTION].insert_many(docs, ordered=False)
+        migrated += len(batch)
+        query = {"_id": {"$gt": batch[-1]["_id"]}}
+        await db_jobs.migrations.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"last_id": batch[-1]["_id"], "migrated": migrated}},
+            upsert=True
+        )
+        print(f"Migrated {migrated} audit entries")
+
+    if drop_source:
+        await db_jobs[LEGACY_AUDIT_COLLECTION].drop()
+        print(f"Dropped {LEGACY_AUDIT_COLLECTION}")
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit event storage maintenance.")
+    parser.add_argument("--migrate", action="store_true", help="Copy legacy audit_logs into the time-series collection")
+    parser.add_argument("--drop-source", action="store_true", help="Drop audit_logs after a complete migration")
+    args = parser.parse_args()
+    if args.migrate:
+        asyncio.run(migrate_audit_logs(args.drop_source))
+    else:
+        asyncio.run(ensure_audit_collection())
+
+
+if __name__ == "__main__":
+    main()
@@ -7,3 +7,12 @@ load_dotenv()
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+
+# The history query cache (app/query_cache.py) can live on its own Redis, so
+# its memory limit and eviction policy never apply to the Celery broker or
+# the rate-limit counters on REDIS_URL. Defaults to the shared instance.
+QUERY_CACHE_REDIS_URL = os.getenv("QUERY_CACHE_REDIS_URL", REDIS_URL)
+query_cache_redis_client = (
+    redis_client if QUERY_CACHE_REDIS_URL == REDIS_URL
+    else redis.from_url(QUERY_CACHE_REDIS_URL, decode_responses=True)
+)
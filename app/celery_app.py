@@ -1,6 +1,7 @@
 # celery_app.py
 import os
 from celery import Celery
+from celery.schedules import crontab
 
 # Use Redis running on localhost (default port 6379)
 CELERY_BROKER_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
@@ -16,5 +17,39 @@ celery_app.conf.update(
     timezone="UTC",
     enable_utc=True,
 )
+
+# Periodic jobs run by `celery -A app.celery_app beat`
+RECONCILE_INTERVAL_SECONDS = int(os.getenv("RECONCILE_INTERVAL_SECONDS", "900"))
+HOT_CREDIT_RELEASE_INTERVAL_SECONDS = int(os.getenv("HOT_CREDIT_RELEASE_INTERVAL_SECONDS", "60"))
+
+celery_app.conf.beat_schedule = {
+    # Re-check only accounts touched since the last checkpoint
+    "reconcile-balances-incremental": {
+        "task": "app.tasks.reconcile_balances",
+        "schedule": RECONCILE_INTERVAL_SECONDS,
+        "kwargs": {"incremental": True},
+    },
+    # Nightly full sweep over all account ranges
+    "reconcile-balances-full": {
+        "task": "app.tasks.reconcile_balances",
+        "schedule": crontab(hour=2, minute=0),
+        "kwargs": {"incremental": False},
+    },
+    # Per-account balance snapshots at the UTC day boundary
+    "snapshot-balances": {
+        "task": "app.tasks.snapshot_balances",
+        "schedule": crontab(hour=0, minute=5),
+    },
+    # Move settled transactions past ARCHIVE_HORIZON_DAYS into monthly archives
+    "archive-transactions": {
+        "task": "app.tasks.archive_transactions",
+        "schedule": crontab(hour=3, minute=0),
+    },
+    # Unclaim crashed hot-credit batches and apply credits no aggregator is handling
+    "release-hot-credit-batches": {
+        "task": "app.tasks.release_hot_credit_batches",
+        "schedule": HOT_CREDIT_RELEASE_INTERVAL_SECONDS,
+    },
+}
 # This will automatically discover tasks in the module "app.tasks"
 celery_app.autodiscover_tasks(["app.tasks"], force=True)
@@ -1,10 +1,11 @@
 import os
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
+from app.monitoring import mongo_latency
 
 # Load environment variables from .env file
-# Load environment variables from .env file
-load_dotenv()
+# Set ENV_FILE to use another profile, e.g. ENV_FILE=.env.replset for the local replica set
+load_dotenv(os.getenv("ENV_FILE", ".env"))
 
 # Get values from .env without defaults
 JWT_SECRET = os.getenv("JWT_SECRET")
@@ -25,5 +26,73 @@ if not MONGO_URI:
 
 # MongoDB Connection
 MONGO_URI = os.getenv("MONGO_URI")
-client = AsyncIOMotorClient(MONGO_URI)
-db = client.banking  # Database name
+MONGO_DB = os.getenv("MONGO_DB", "banking")
+
+# Named database handles. Each handle has its own client so read preference,
+# write concern, pool size, timeouts and compression are tuned independently:
+#   primary   - money movement; majority writes, reads from the primary
+#   analytics - staleness-tolerant reads (history, audit logs, exports);
+#               prefers secondaries that are at most N seconds behind
+#   jobs      - startup and background work (index builds, reconciliation,
+#               snapshots, archival, imports, migrations); primary and
+#               majority like `primary`, but no socket timeout, since single
+#               commands can legitimately run for minutes
+# Every option can be overridden with MONGO_<HANDLE>_<OPTION>, e.g.
+# MONGO_ANALYTICS_MAX_POOL_SIZE=50 or MONGO_PRIMARY_COMPRESSORS=zstd,zlib.
+DB_HANDLE_SETTINGS = {
+    "primary": {
+        "readPreference": "primary",
+        "w": "majority",
+        "maxPoolSize": 100,
+        "serverSelectionTimeoutMS": 5000,
+        "socketTimeoutMS": 10000,
+        "compressors": "zlib",
+    },
+    "analytics": {
+        "readPreference": "secondaryPreferred",
+        "maxStalenessSeconds": 120,
+        "w": 1,
+        "maxPoolSize": 20,
+        "serverSelectionTimeoutMS": 5000,
+        "socketTimeoutMS": 60000,
+        "compressors": "zlib",
+    },
+    "jobs": {
+        "readPreference": "primary",
+        "w": "majority",
+        "maxPoolSize": 20,
+        "serverSelectionTimeoutMS": 5000,
+        "compressors": "zlib",
+    },
+}
+
+ENV_OPTION_NAMES = {
+    "maxPoolSize": "MAX_POOL_SIZE",
+    "serverSelectionTimeoutMS": "SERVER_SELECTION_TIMEOUT_MS",
+    "socketTimeoutMS": "SOCKET_TIMEOUT_MS",
+    "maxStalenessSeconds": "MAX_STALENESS_SECONDS",
+    "compressors": "COMPRESSORS",
+}
+
+def _handle_options(handle: str, defaults: dict) -> dict:
+    options = dict(defaults)
+    for option, env_name in ENV_OPTION_NAMES.items():
+        value = os.getenv(f"MONGO_{handle.upper()}_{env_name}")
+        if value:
+            options[option] = value if option == "compressors" else int(value)
+    return options
+
+# Command latency feeds admission control (app/admission.py)
+clients = {
+    handle: AsyncIOMotorClient(MONGO_URI, event_listeners=[mongo_latency], **_handle_options(handle, defaults))
+    for handle, defaults in DB_HANDLE_SETTINGS.items()
+}
+db_handles = {handle: handle_client[MONGO_DB] for handle, handle_client in clients.items()}
+
+db_primary = db_handles["primary"]
+db_analytics = db_handles["analytics"]
+db_jobs = db_handles["jobs"]
+
+# Default handle used by money movement and anything that needs its own writes
+client = clients["primary"]
+db = db_primary
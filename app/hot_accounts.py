@@ -0,0 +1,216 @@
+# hot_accounts.py
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+
+from app.cache import redis_client
+from app.config import client, db
+from app.monitoring import route_class_var
+
+HOT_CREDIT_RATE_THRESHOLD = int(os.getenv("HOT_CREDIT_RATE_THRESHOLD", "50"))  # Credits/second that mark an account hot
+HOT_FLUSH_INTERVAL_MS = int(os.getenv("HOT_FLUSH_INTERVAL_MS", "20"))          # How often pending credits are folded in
+HOT_AGGREGATOR_IDLE_SECONDS = 5        # Aggregator task exits after this long with nothing to apply
+HOT_FLAG_CACHE_SECONDS = 5             # In-process cache of each account's hot flag
+STALE_BATCH_SECONDS = 60               # Claimed batches older than this were abandoned by a crash
+
+# Accounts with a high fan-in of credits (merchants) would serialize every
+# transfer on one document. For hot accounts, credits are appended to
+# hot_credits instead, and a per-account aggregator periodically claims the
+# pending entries and applies them as one summed $inc. The $inc and the
+# deletion of the applied entries happen in one transaction, so a credit
+# is counted either in the balance or in hot_credits, never both.
+
+_hot_flags = {}      # account_number -> (expires_at, hot)
+_aggregators = {}    # account_number -> asyncio.Task
+_draining = set()    # Accounts whose aggregator should stop after its current tick
+
+
+async def is_hot(account_number: str) -> bool:
+    cached = _hot_flags.get(account_number)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    account = await db.accounts.find_one({"account_number": account_number}, {"hot": 1})
+    hot = bool(account and account.get("hot"))
+    _hot_flags[account_number] = (time.monotonic() + HOT_FLAG_CACHE_SECONDS, hot)
+    return hot
+
+
+async def set_hot(account_number: str, hot: bool) -> bool:
+    result = await db.accounts.update_one(
+        {"account_number": account_number},
+        {"$set": {"hot": hot, "hot_since": datetime.utcnow() if hot else None}}
+    )
+    _hot_flags[account_number] = (time.monotonic() + HOT_FLAG_CACHE_SECONDS, hot)
+    if not hot and result.matched_count:
+        # Fold in what is still pending, including credits from processes
+        # whose cached flag still says hot.
+        ensure_aggregator(account_number)
+    return result.matched_count > 0
+
+
+async def _credit_rate_exceeded(account_number: str) -> bool:
+    key = f"credit_rate:{account_number}:{int(time.time())}"
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.incr(key)
+    pipe.expire(key, 2)
+    count, _ = await pipe.execute()
+    return count >= HOT_CREDIT_RATE_THRESHOLD
+
+
+async def credit_account(account_number: str, amount: float, reference: str, account: Optional[Dict] = None) -> bool:
+    """
+    Credit `amount` to an account. Returns False if the account does not
+    exist. Pass the account document when it has already been read, so its
+    hot flag does not need another lookup.
+    """
+    hot = bool(account.get("hot")) if account is not None else await is_hot(account_number)
+    if not hot:
+        result = await db.accounts.update_one({"account_number": account_number}, {"$inc": {"balance": amount}})
+        if result.modified_count == 0:
+            return False
+        # Accounts receiving credits faster than the threshold switch to the
+        # hot path. The credit is already applied, so a failure here must not
+        # reach the caller.
+        try:
+            if await _credit_rate_exceeded(account_number):
+                await set_hot(account_number, True)
+        except Exception as exc:
+            print(f"Credit rate check failed for {account_number}: {exc}")
+        return True
+
+    await db.hot_credits.insert_one({
+        "account_number": account_number,
+        "amount": amount,
+        "reference": reference,
+        "created_at": datetime.utcnow(),
+        "batch": None
+    })
+    ensure_aggregator(account_number)
+    return True
+
+
+async def pending_hot_credits(account_numbers: List[str], database=None) -> Dict[str, float]:
+    """Credits recorded for these accounts but not yet folded into their balance."""
+    database = database if database is not None else db
+    rows = await database.hot_credits.aggregate([
+        {"$match": {"account_number": {"$in": account_numbers}}},
+        {"$group": {"_id": "$account_number", "total": {"$sum": "$amount"}}}
+    ]).to_list(length=None)
+    return {row["_id"]: row["total"] for row in rows}
+
+
+async def effective_balance(account: Dict, database=None) -> float:
+    """
+    Stored balance plus pending hot credits. Accounts that are no longer hot
+    can still have some until the aggregator catches up, so the flag is not
+    consulted. Pass the handle the account was read through.
+    """
+    pending = await pending_hot_credits([account["account_number"]], database)
+    return round(account["balance"] + pending.get(account["account_number"], 0.0), 2)
+
+
+async def flush_hot_credits(account_number: str) -> int:
+    """Fold this account's pending credits into its balance with one $inc; returns credits applied."""
+    batch_id = ObjectId()
+    claim = await db.hot_credits.update_many(
+        {"account_number": account_number, "batch": None},
+        {"$set": {"batch": batch_id, "claimed_at": datetime.utcnow()}}
+    )
+    if claim.modified_count == 0:
+        return 0
+    rows = await db.hot_credits.aggregate([
+        {"$match": {"batch": batch_id}},
+        {"$group": {"_id": None, "total": {"$sum": "$amount"}, "count": {"$sum": 1}}}
+    ]).to_list(length=None)
+    if not rows:
+        return 0
+
+    applied = False
+    try:
+        async with await client.start_session() as session:
+            async with session.start_transaction():
+                # Delete first: if this flush stalled past STALE_BATCH_SECONDS,
+                # release_stale_batches may have handed some entries to another
+                # flush that already applied them, and the summed total would
+                # count them twice.
+                deleted = await db.hot_credits.delete_many({"batch": batch_id}, session=session)
+                if deleted.deleted_count != rows[0]["count"]:
+                    await session.abort_transaction()
+                else:
+                    await db.accounts.update_one(
+                        {"account_number": account_number},
+                        {"$inc": {"balance": rows[0]["total"]}},
+                        session=session
+                    )
+                    applied = True
+    except Exception:
+        # Nothing was applied; hand the entries back to the next flush.
+        await db.hot_credits.update_many({"batch": batch_id}, {"$set": {"batch": None}})
+        raise
+    if not applied:
+        print(f"Hot credit batch {batch_id} for {account_number} changed while claimed; left to the next flush")
+        await db.hot_credits.update_many({"batch": batch_id}, {"$set": {"batch": None}})
+        return 0
+    return rows[0]["count"]
+
+
+async def _run_aggregator(account_number: str):
+    # Started from inside a request; its flushes are background work, not
+    # latency of that request's route class.
+    route_class_var.set(None)
+    last_applied = time.monotonic()
+    try:
+        while time.monotonic() - last_applied < HOT_AGGREGATOR_IDLE_SECONDS and account_number not in _draining:
+            await asyncio.sleep(HOT_FLUSH_INTERVAL_MS / 1000)
+            try:
+                if await flush_hot_credits(account_number):
+                    last_applied = time.monotonic()
+            except Exception as exc:
+                # The entries were unclaimed and are retried on the next tick.
+                print(f"Hot credit flush failed for {account_number}: {exc}")
+    finally:
+        _aggregators.pop(account_number, None)
+
+
+def ensure_aggregator(account_number: str):
+    task = _aggregators.get(account_number)
+    if task is None or task.done():
+        _aggregators[account_number] = asyncio.create_task(_run_aggregator(account_number))
+
+
+async def drain_aggregators():
+    """
+    Stop this process's aggregators after a final flush. Celery workers call
+    this after a task, since their event loop only runs while a task does.
+    """
+    running = dict(_aggregators)
+    _draining.update(running)
+    try:
+        # Let each aggregator finish its current tick instead of cancelling it
+        # mid-flush, which could leave a batch claimed.
+        await asyncio.gather(*running.values(), return_exceptions=True)
+        for account_number in running:
+            await flush_hot_credits(account_number)
+    finally:
+        _draining.difference_update(running)
+
+
+async def release_stale_batches() -> Dict:
+    """
+    Unclaim batches left behind by a crashed process (their transaction never
+    committed) and restart aggregators for every account with pending
+    credits, including credits whose aggregator exited or died. Run at
+    startup and periodically (the release-hot-credit-batches beat job).
+    """
+    released = await db.hot_credits.update_many(
+        {"batch": {"$ne": None}, "claimed_at": {"$lt": datetime.utcnow() - timedelta(seconds=STALE_BATCH_SECONDS)}},
+        {"$set": {"batch": None}}
+    )
+    account_numbers = await db.hot_credits.distinct("account_number")
+    for account_number in account_numbers:
+        ensure_aggregator(account_number)
+    return {"released": released.modified_count, "accounts": len(account_numbers)}
@@ -0,0 +1,411 @@
+# indexes.py
+"""
+Index catalog for every collection, designed around the queries the routes
+and jobs actually issue, plus an explain()-based check of those query shapes.
+
+Run the check against a scratch database (never the configured one):
+    INDEX_CHECK_MONGO_URI=mongodb://localhost:27017 python -m app.indexes
+The check recreates INDEX_CHECK_DB, seeds it with representative documents,
+applies the catalog and explains every shape. It exits non-zero if a shape
+uses a collection scan, examines too many keys per document returned, or
+returns nothing (the seed data no longer exercises it).
+
+Make accounts.user_id unique on an existing database (explicit migration,
+never done at startup; MongoDB 6.0+):
+    python -m app.indexes --unique-account-user-id
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from app.config import db, db_jobs
+
+IDEMPOTENCY_KEY_RETENTION_DAYS = int(os.getenv("IDEMPOTENCY_KEY_RETENTION_DAYS", "730"))  # Longer than any client retry window
+INDEX_CHECK_MONGO_URI = os.getenv("INDEX_CHECK_MONGO_URI", "mongodb://localhost:27017")
+INDEX_CHECK_DB = os.getenv("INDEX_CHECK_DB", "banking_index_check")
+
+SUCCESS_TRANSFERS = {"type": "transfer", "status": "success"}
+SETTLED_LATER = {"updated_at": {"$exists": True}}
+
+# Indexes keep the server's default names (e.g. user_id_1), so indexes that
+# already exist are recognised rather than rebuilt under a new name.
+INDEX_CATALOG = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "accounts": [
+        # Unique so concurrent create-account upserts cannot both insert. An
+        # existing non-unique user_id_1 is converted by the explicit migration
+        # (make_account_user_id_unique), not here.
+        IndexModel([("user_id", ASCENDING)], unique=True),
+        IndexModel([("account_number", ASCENDING)], unique=True),
+    ],
+    "transactions": [
+        # Idempotency lookup on every money-movement request
+        IndexModel([("idempotency_key", ASCENDING)], unique=True),
+        # check_fraud daily/hourly totals, filter_transactions, ledger owner side.
+        # Equality fields first, the timestamp range last.
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING), ("type", ASCENDING), ("timestamp", ASCENDING)]),
+        # check_fraud transfers-to-recipient rule
+        IndexModel([("user_id", ASCENDING), ("to_account", ASCENDING), ("timestamp", ASCENDING)],
+                   partialFilterExpression=SUCCESS_TRANSFERS),
+        # Ledger recipient side (reconciliation, snapshots, balance-at)
+        IndexModel([("to_account", ASCENDING), ("timestamp", ASCENDING)],
+                   partialFilterExpression=SUCCESS_TRANSFERS),
+        # /pending and bulk claims only ever touch the small pending subset
+        IndexModel([("status", ASCENDING), ("timestamp", ASCENDING)],
+                   partialFilterExpression={"status": "pending"}),
+        # Ledger windows on settlement time for approved pending items
+        # (ledger.settlement_window); other items use the timestamp indexes
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING), ("updated_at", ASCENDING)],
+                   partialFilterExpression=SETTLED_LATER),
+        IndexModel([("to_account", ASCENDING), ("updated_at", ASCENDING)],
+                   partialFilterExpression={**SUCCESS_TRANSFERS, **SETTLED_LATER}),
+        # Archival range scan on age
+        IndexModel([("timestamp", ASCENDING)]),
+        # Incremental reconciliation: settlement time of approved pending items
+        IndexModel([("updated_at", ASCENDING)], sparse=True),
+        # Items claimed by bulk approval jobs
+        IndexModel([("claim_id", ASCENDING)], sparse=True),
+    ],
+    # Keys of archived transactions (see archive._retain_idempotency_keys)
+    "idempotency_keys": [
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=IDEMPOTENCY_KEY_RETENTION_DAYS * 24 * 3600),
+    ],
+    "balance_snapshots": [
+        IndexModel([("account_number", ASCENDING), ("ts", DESCENDING)], unique=True),
+    ],
+    "hot_credits": [
+        # Pending credits per hot account (flush claims, balance reads)
+        IndexModel([("account_number", ASCENDING), ("batch", ASCENDING)]),
+        IndexModel([("batch", ASCENDING), ("claimed_at", ASCENDING)]),
+    ],
+    "reconciliation_discrepancies": [
+        IndexModel([("run_id", ASCENDING)]),
+        # Open row per account (upserted while a mismatch persists, resolved once clean)
+        IndexModel([("account_number", ASCENDING), ("resolved_at", ASCENDING)]),
+    ],
+}
+
+# Indexes on monthly transactions_archive_* collections (history and ledger reads)
+ARCHIVE_INDEXES = [
+    IndexModel([("user_id", ASCENDING), ("status", ASCENDING), ("type", ASCENDING), ("timestamp", ASCENDING)]),
+    IndexModel([("to_account", ASCENDING), ("timestamp", ASCENDING)], partialFilterExpression=SUCCESS_TRANSFERS),
+    IndexModel([("user_id", ASCENDING), ("status", ASCENDING), ("updated_at", ASCENDING)],
+               partialFilterExpression=SETTLED_LATER),
+    IndexModel([("to_account", ASCENDING), ("updated_at", ASCENDING)],
+               partialFilterExpression={**SUCCESS_TRANSFERS, **SETTLED_LATER}),
+]
+
+# Indexes made redundant by a catalog index they are a prefix of, mapped to
+# that index's key. Each is dropped only once its replacement exists.
+SUPERSEDED_INDEXES = {
+    "transactions": {
+        "user_id_1": [("user_id", 1), ("status", 1), ("type", 1), ("timestamp", 1)],
+    },
+}
+
+INDEX_OPTIONS = ["unique", "sparse", "partialFilterExpression", "expireAfterSeconds"]
+
+
+def _key(fields) -> tuple:
+    return tuple((field, direction if isinstance(direction, str) else int(direction)) for field, direction in fields)
+
+
+def _option_differences(existing: Dict, wanted: Dict) -> List[str]:
+    differences = []
+    for option in INDEX_OPTIONS:
+        have, want = existing.get(option), wanted.get(option)
+        if option in ["unique", "sparse"]:
+            have, want = bool(have), bool(want)
+        if have != want:
+            differences.append(f"{option}: {have!r} (catalog: {want!r})")
+    return differences
+
+
+async def _ensure_collection_indexes(collection, models: List[IndexModel]):
+    """
+    Create the catalog indexes the collection lacks. An index already present
+    on the same key (whatever its name) is left alone; if its options differ
+    from the catalog they are reported, since changing them takes a rebuild
+    or a migration that must not happen as a side effect of startup.
+    """
+    existing = await collection.index_information()
+    by_key = {_key(info["key"]): (name, info) for name, info in existing.items()}
+    missing = []
+    for model in models:
+        wanted = model.document
+        found = by_key.get(_key(wanted["key"].items()))
+        if not found:
+            missing.append(model)
+            continue
+        name, info = found
+        differences = _option_differences(info, wanted)
+        if differences:
+            print(f"Index {collection.name}.{name} differs from the catalog ({'; '.join(differences)}); left as is")
+    if missing:
+        await collection.create_indexes(missing)
+
+
+async def ensure_indexes(database=None):
+    """
+    Create missing catalog indexes, then drop superseded ones whose
+    replacement exists. Existing indexes are never dropped and rebuilt, so
+    uniqueness (email, idempotency_key) holds throughout a rolling deploy.
+    """
+    database = database if database is not None else db_jobs
+    for collection, models in INDEX_CATALOG.items():
+        await _ensure_collection_indexes(database[collection], models)
+
+    for collection, superseded in SUPERSEDED_INDEXES.items():
+        existing = await database[collection].index_information()
+        present = {_key(info["key"]) for info in existing.values()}
+        for name, replacement in superseded.items():
+            if name in existing and _key(replacement) in present:
+                await database[collection].drop_index(name)
+
+    # Archived months get new ARCHIVE_INDEXES too, not just the ones created from now on
+    for entry in await database.archive_catalog.find({}, {"_id": 1}).to_list(length=None):
+        await _ensure_collection_indexes(database[entry["_id"]], ARCHIVE_INDEXES)
+    print("Indexes created successfully.")
+
+
+async def _duplicate_user_ids(database) -> List[Dict]:
+    return await database.accounts.aggregate([
+        {"$group": {"_id": "$user_id", "count": {"$sum": 1}, "accounts": {"$push": "$account_number"}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True).to_list(length=None)
+
+
+async def make_account_user_id_unique(database=None) -> bool:
+    """
+    Convert the existing accounts.user_id index to unique in place. The index
+    is first switched to prepareUnique, so no new duplicates can be written,
+    and only then are existing duplicates looked for. If any exist they are
+    listed and the index stays non-unique (still rejecting new duplicates)
+    until they are resolved and the migration is re-run. Returns True once
+    the index is unique.
+    """
+    database = database if database is not None else db_jobs
+    existing = await database.accounts.index_information()
+    name = next((n for n, info in existing.items() if _key(info["key"]) == (("user_id", 1),)), None)
+    if name and existing[name].get("unique"):
+        print(f"accounts.{name} is already unique")
+        return True
+
+    if name:
+        await database.command({"collMod": "accounts", "index": {"name": name, "prepareUnique": True}})
+    duplicates = await _duplicate_user_ids(database)
+    if duplicates:
+        for row in duplicates[:50]:
+            print(f"user_id {row['_id']} has {row['count']} accounts: {', '.join(row['accounts'])}")
+        print(f"{len(duplicates)} user_ids have more than one account; resolve them and re-run")
+        return False
+
+    if name:
+        await database.command({"collMod": "accounts", "index": {"name": name, "unique": True}})
+    else:
+        await database.accounts.create_index([("user_id", ASCENDING)], unique=True)
+    print("accounts.user_id is now unique")
+    return True
+
+
+# Values the query shapes ask for. The seed data gives every shape some
+# matching documents among many it has to skip.
+SAMPLE_USER_ID = f"{0:024x}"
+SAMPLE_EMAIL = "user0@example.com"
+SAMPLE_ACCOUNT = "10000000008"
+SAMPLE_RECIPIENT = "10000000016"
+SAMPLE_IDEMPOTENCY_KEY = "seed-0-0"
+SAMPLE_CLAIM_ID = "seed-job"
+SEED_USERS = 50
+SEED_TRANSACTIONS_PER_USER = 40
+
+
+async def _seed(database, now: datetime):
+    rng = random.Random(31)
+    user_ids = [f"{i:024x}" for i in range(SEED_USERS)]
+    accounts = [SAMPLE_ACCOUNT, SAMPLE_RECIPIENT] + [str(10000000024 + 8 * i) for i in range(SEED_USERS - 2)]
+
+    await database.users.insert_many([
+        {"name": f"User {i}", "email": f"user{i}@example.com", "hashed_password": "x", "role": "customer"}
+        for i in range(SEED_USERS)
+    ])
+    await database.accounts.insert_many([
+        {"user_id": user_id, "account_number": number, "balance": 0.0, "locked": False, "txn_version": 1}
+        for user_id, number in zip(user_ids, accounts)
+    ])
+
+    transactions = []
+    for u, user_id in enumerate(user_ids):
+        for t in range(SEED_TRANSACTIONS_PER_USER):
+            txn_type = rng.choice(["deposit", "withdraw", "transfer"])
+            status = rng.choices(["success", "failed", "blocked", "pending", "processing"], [70, 10, 5, 10, 5])[0]
+            timestamp = now - timedelta(days=rng.uniform(1, 120))
+            txn = {"user_id": user_id, "account_number": accounts[u], "amount": round(rng.uniform(1, 5000), 2),
+                   "type": txn_type, "timestamp": timestamp, "idempotency_key": f"seed-{u}-{t}", "status": status}
+            if txn_type == "transfer":
+                txn["to_account"] = rng.choice(accounts)
+            if status == "processing":
+                txn["claim_id"] = SAMPLE_CLAIM_ID
+            if status in ["success", "failed"] and rng.random() < 0.1:
+                txn["updated_at"] = timestamp + timedelta(hours=rng.uniform(1, 48))
+            transactions.append(txn)
+
+    # Today's activity for the sample user, so the fraud, history and ledger
+    # window shapes have something to return.
+    recent = [
+        {"type": "deposit", "status": "success", "timestamp": now - timedelta(minutes=20)},
+        {"type": "transfer", "status": "success", "timestamp": now - timedelta(minutes=10), "to_account": SAMPLE_RECIPIENT},
+        {"type": "withdraw", "status": "success", "timestamp": now - timedelta(days=3), "updated_at": now - timedelta(minutes=5)},
+        {"type": "withdraw", "status": "pending", "timestamp": now - timedelta(hours=2)},
+    ]
+    for i, txn in enumerate(recent):
+        transactions.append({"user_id": SAMPLE_USER_ID, "account_number": SAMPLE_ACCOUNT, "amount": 100.0,
+                             "idempotency_key": f"seed-recent-{i}", **txn})
+    await database.transactions.insert_many(transactions)
+
+    await database.balance_snapshots.insert_many([
+        {"account_number": number, "ts": (now - timedelta(days=day)).replace(hour=0, minute=0, second=0, microsecond=0),
+         "balance": 0.0}
+        for number in accounts for day in range(10)
+    ])
+    await database.hot_credits.insert_many([
+        {"account_number": accounts[i % 5], "amount": 1.0, "reference": f"seed-{i}", "created_at": now,
+         "batch": ObjectId() if i % 3 == 0 else None}
+        for i in range(200)
+    ])
+
+
+def _query_shapes() -> List[Dict]:
+    """
+    Representative instance of every indexed query the routes and jobs issue.
+    Unbounded admin listings (/all-transactions, /audit-logs) scan by design
+    and are not listed.
+    """
+    from app.ledger import _owner_side_pipeline, _recipient_side_pipeline, settlement_window
+    from app.queries import (archivable_filter, claimed_filter, fraud_daily_filter, fraud_hourly_filter,
+                             fraud_recipient_filter, history_filter, pending_filter, touched_filter)
+
+    now = datetime.utcnow()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    today_end = now.replace(hour=23, minute=59, second=59, microsecond=999999)
+    user_id = SAMPLE_USER_ID
+    return [
+        {"name": "users.by_email", "collection": "users", "filter": {"email": SAMPLE_EMAIL}},
+        {"name": "accounts.by_user", "collection": "accounts", "filter": {"user_id": user_id}},
+        {"name": "accounts.by_number", "collection": "accounts", "filter": {"account_number": SAMPLE_ACCOUNT}},
+        {"name": "txn.idempotency", "collection": "transactions", "filter": {"idempotency_key": SAMPLE_IDEMPOTENCY_KEY}},
+        {"name": "fraud.daily_total", "collection": "transactions",
+         "filter": fraud_daily_filter(user_id, today, today_end)},
+        {"name": "fraud.hourly_count", "collection": "transactions",
+         "filter": fraud_hourly_filter(user_id, now - timedelta(hours=1))},
+        {"name": "fraud.recipient_count", "collection": "transactions",
+         "filter": fraud_recipient_filter(user_id, SAMPLE_RECIPIENT, today, today_end)},
+        {"name": "history.user", "collection": "transactions", "filter": history_filter(user_id)},
+        {"name": "history.type_status_range", "collection": "transactions",
+         "filter": history_filter(user_id, "deposit", "success", today - timedelta(days=30), today_end)},
+        {"name": "pending.list", "collection": "transactions", "filter": pending_filter()},
+        {"name": "pending.bulk_claim", "collection": "transactions",
+         "filter": pending_filter(txn_type="withdraw", before=now)},
+        {"name": "pending.claimed", "collection": "transactions", "filter": claimed_filter(SAMPLE_CLAIM_ID)},
+        {"name": "archive.move", "collection": "transactions",
+         "filter": archivable_filter(now - timedelta(days=90), now)},
+        {"name": "reconcile.touched", "collection": "transactions", "filter": touched_filter(today)},
+        {"name": "snapshot.nearest", "collection": "balance_snapshots", "filter": {
+            "account_number": SAMPLE_ACCOUNT, "ts": {"$lte": now}}, "sort": {"ts": -1}},
+        {"name": "hot.pending_credits", "collection": "hot_credits", "filter": {
+            "account_number": SAMPLE_ACCOUNT, "batch": None}},
+        {"name": "ledger.owner_side", "collection": "transactions",
+         "pipeline": _owner_side_pipeline([user_id], settlement_window(today, now))},
+        {"name": "ledger.recipient_side", "collection": "transactions",
+         "pipeline": _recipient_side_pipeline([SAMPLE_RECIPIENT], settlement_window(today, now))},
+    ]
+
+
+def _walk(node, found: Dict):
+    """Collect plan stages and the first executionStats block from explain output."""
+    if isinstance(node, dict):
+        if "stage" in node:
+            found["stages"].append(node["stage"])
+        if "executionStats" in node and "stats" not in found:
+            found["stats"] = node["executionStats"]
+        for value in node.values():
+            _walk(value, found)
+    elif isinstance(node, list):
+        for value in node:
+            _walk(value, found)
+
+
+async def explain_shape(database, shape: Dict, max_keys_per_doc: float = 10.0) -> Dict:
+    if "pipeline" in shape:
+        command = {"aggregate": shape["collection"], "pipeline": shape["pipeline"], "cursor": {}}
+    else:
+        command = {"find": shape["collection"], "filter": shape["filter"]}
+        if "sort" in shape:
+            command["sort"] = shape["sort"]
+    explained = await database.command("explain", command, verbosity="executionStats")
+
+    found = {"stages": []}
+    _walk(explained, found)
+    stats = found.get("stats", {})
+    keys_examined = stats.get("totalKeysExamined", 0)
+    returned = stats.get("nReturned", 0)
+    ratio = keys_examined / max(returned, 1)
+
+    problems = []
+    if "COLLSCAN" in found["stages"]:
+        problems.append("collection scan")
+    if returned == 0:
+        problems.append("returned nothing; the seed data does not exercise this shape")
+    if ratio > max_keys_per_doc:
+        problems.append(f"{keys_examined} keys examined for {returned} returned")
+    return {"name": shape["name"], "stages": sorted(set(found["stages"])), "ratio": round(ratio, 2), "problems": problems}
+
+
+async def check_query_plans(database, max_keys_per_doc: float = 10.0) -> List[Dict]:
+    """Explain every query shape against `database`; returns the shapes with plan problems."""
+    results = [await explain_shape(database, shape, max_keys_per_doc) for shape in _query_shapes()]
+    for result in results:
+        status = "FAIL" if result["problems"] else "ok"
+        print(f"{status:4} {result['name']:28} ratio={result['ratio']:<6} {', '.join(result['problems'])}")
+    return [result for result in results if result["problems"]]
+
+
+async def _check_main() -> int:
+    if INDEX_CHECK_DB == db.name:
+        print(f"INDEX_CHECK_DB must not be the application database ({db.name}); it is dropped and reseeded")
+        return 2
+    scratch_client = AsyncIOMotorClient(INDEX_CHECK_MONGO_URI)
+    scratch = scratch_client[INDEX_CHECK_DB]
+    try:
+        await scratch_client.drop_database(INDEX_CHECK_DB)
+        await _seed(scratch, datetime.utcnow())
+        await ensure_indexes(scratch)
+        failures = await check_query_plans(scratch)
+    finally:
+        await scratch_client.drop_database(INDEX_CHECK_DB)
+        scratch_client.close()
+    return 1 if failures else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Explain-based index check, and index migrations.")
+    parser.add_argument("--unique-account-user-id", action="store_true",
+                        help="Convert accounts.user_id to a unique index on the configured database")
+    args = parser.parse_args()
+    if args.unique_account_user_id:
+        return 0 if asyncio.run(make_account_user_id_unique()) else 1
+    return asyncio.run(_check_main())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
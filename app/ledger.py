@@ -0,0 +1,105 @@
+# ledger.py
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.archive import collections_for_range
+
+# Ledger semantics of a successful transaction log:
+#   deposit  -> +amount on the owner's account (user_id)
+#   withdraw -> -amount on the owner's account (user_id)
+#   transfer -> -amount on the sender (user_id), +amount on "to_account"
+# Owner-side effects are keyed by user_id because pending withdrawals/transfers
+# are logged with account_number "unknown" and keep it after approval.
+#
+# Time windows are on settlement time: an approved pending item moves funds
+# at approval (updated_at), everything else when it is logged (timestamp).
+
+
+def settlement_window(start: Optional[datetime] = None, end: Optional[datetime] = None) -> Optional[List[Dict]]:
+    """
+    Alternatives matching transactions settled in (start, end]; None when
+    both bounds are open. Each alternative is served by its own index.
+    """
+    window = {}
+    if start:
+        window["$gt"] = start
+    if end:
+        window["$lte"] = end
+    if not window:
+        return None
+    return [{"updated_at": window}, {"updated_at": None, "timestamp": window}]
+
+
+def _windowed(match: Dict, window: Optional[List[Dict]]) -> Dict:
+    # The side's own predicates go into every $or branch so each branch
+    # can use an index (including partial ones) on its own.
+    if not window:
+        return match
+    return {"$or": [{**match, **alternative} for alternative in window]}
+
+
+def _owner_side_pipeline(user_ids: List[str], window: Optional[List[Dict]] = None) -> List[Dict]:
+    match = {"status": "success", "user_id": {"$in": user_ids}}
+    return [
+        {"$match": _windowed(match, window)},
+        {"$group": {
+            "_id": "$user_id",
+            "delta": {"$sum": {"$cond": [
+                {"$eq": ["$type", "deposit"]},
+                "$amount",
+                {"$multiply": ["$amount", -1]}
+            ]}}
+        }}
+    ]
+
+
+def _recipient_side_pipeline(account_numbers: List[str], window: Optional[List[Dict]] = None) -> List[Dict]:
+    match = {"status": "success", "type": "transfer", "to_account": {"$in": account_numbers}}
+    return [
+        {"$match": _windowed(match, window)},
+        {"$group": {"_id": "$to_account", "delta": {"$sum": "$amount"}}}
+    ]
+
+
+async def ledger_deltas(collection, accounts: List[Dict], window: Optional[List[Dict]] = None) -> Dict[str, float]:
+    """
+    Net ledger effect of successful transactions in `collection` for each account.
+    `accounts` are account documents (only user_id and account_number are used);
+    the result is keyed by account_number. `window` (see settlement_window)
+    narrows both sides to a settlement-time range.
+    """
+    if not accounts:
+        return {}
+    user_to_account = {acc["user_id"]: acc["account_number"] for acc in accounts}
+    account_numbers = list(user_to_account.values())
+
+    owner_rows, recipient_rows = await asyncio.gather(
+        collection.aggregate(_owner_side_pipeline(list(user_to_account), window)).to_list(length=None),
+        collection.aggregate(_recipient_side_pipeline(account_numbers, window)).to_list(length=None),
+    )
+
+    deltas = {number: 0.0 for number in account_numbers}
+    for row in owner_rows:
+        deltas[user_to_account[row["_id"]]] += row["delta"]
+    for row in recipient_rows:
+        deltas[row["_id"]] += row["delta"]
+    return deltas
+
+
+async def tiered_ledger_deltas(accounts: List[Dict], start: Optional[datetime] = None,
+                               end: Optional[datetime] = None, database=None) -> Dict[str, float]:
+    """
+    ledger_deltas for transactions settled in (start, end], summed over the
+    hot collection and every archived month that can hold such a settlement.
+    Both bounds are optional; `database` picks the handle (default: primary).
+    """
+    window = settlement_window(start, end)
+    collections = await collections_for_range(start, end, database, by_settlement=True)
+    per_tier = await asyncio.gather(*[ledger_deltas(c, accounts, window) for c in collections])
+
+    totals = {acc["account_number"]: 0.0 for acc in accounts}
+    for deltas in per_tier:
+        for account_number, delta in deltas.items():
+            totals[account_number] += delta
+    return totals
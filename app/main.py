@@ -1,28 +1,27 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
 from contextlib import asynccontextmanager
 from app.routes import users, accounts, transactions
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from dotenv import load_dotenv
-from app.config import db
+from app.indexes import ensure_indexes
+from app.query_cache import configure_redis_memory
+from app.audit_store import ensure_audit_collection
+from app.hot_accounts import release_stale_batches
+from app.admission import admission_controller, ADMISSION_ENABLED
+from app.utils import require_roles
 load_dotenv()
 
 limiter = Limiter(key_func=get_remote_address)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Create indexes
-    # Users Collection
-    await db.users.create_index("email", unique=True)
-    # Accounts Collection
-    await db.accounts.create_index("user_id")
-    await db.accounts.create_index("account_number", unique=True)
-    # Transactions Collection
-    await db.transactions.create_index("user_id")
-    await db.transactions.create_index("timestamp")
-    await db.transactions.create_index("idempotency_key", unique=True)
-    await db.transactions.create_index([("type", 1), ("status", 1)])
-    print("Indexes created successfully.")
+    # Startup: Create indexes (see app/indexes.py for the catalog)
+    await ensure_indexes()
+    await ensure_audit_collection()
+    # Resume folding in hot-account credits left pending by the last run
+    await release_stale_batches()
+    await configure_redis_memory()
     
     yield  
 
@@ -33,6 +32,13 @@ async def limit_requests(request, call_next):
     response = await limiter.limit("100/minute")(call_next)(request)
     return response
 
+# Registered last so it runs first: shed load before doing any other work.
+@app.middleware("http")
+async def admission_control(request, call_next):
+    if not ADMISSION_ENABLED:
+        return await call_next(request)
+    return await admission_controller.handle(request, call_next)
+
 # Include Routes
 app.include_router(users.router, prefix="/users", tags=["Users"])
 app.include_router(accounts.router, prefix="/bank", tags=["Accounts"])
@@ -41,3 +47,8 @@ app.include_router(transactions.router, prefix="/transactions", tags=["Transacti
 @app.get("/")
 async def root():
     return {"message": "Banking API is running!"}
+
+@app.get("/admission", dependencies=[Depends(require_roles(["admin"]))])
+async def admission_stats():
+    # Per route-class limits, queue depth, shed counts, queue wait vs service time
+    return admission_controller.stats()
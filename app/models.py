@@ -3,7 +3,7 @@ from typing import Optional, Dict
 from bson import ObjectId
 import datetime
 from datetime import datetime  
-from typing import Optional, Literal
+from typing import Optional, Literal, List
 
 # Pydantic Model for User Registration
 class UserCreate(BaseModel):
@@ -50,7 +50,8 @@ class TransactionLog(BaseModel):
     timestamp: datetime = datetime.utcnow()
     idempotency_key: str
     # Status can be "success", "pending", "failed", "blocked", etc.
-    status: Literal["success", "failed", "blocked", "pending"] = "success"
+    # "processing" marks pending items claimed by a bulk job or a single approval.
+    status: Literal["success", "failed", "blocked", "pending", "processing"] = "success"
     # If you want to store the recipient in case of transfers
     to_account: Optional[str] = None
 
@@ -66,4 +67,16 @@ class AuditLog(BaseModel):
     action: str  # e.g., "login", "deposit", "withdraw", "transfer", "approve_transaction"
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     ip_address: Optional[str] = None
-    details: Optional[Dict] = None  # Additional info about the action
\ No newline at end of file
+    details: Optional[Dict] = None  # Additional info about the action
+
+# Bulk approval/rejection of pending transactions
+class BulkPendingRequest(BaseModel):
+    action: Literal["approve", "reject"]
+    # Explicit transaction ids; when omitted the filter fields below are used
+    txn_ids: Optional[List[str]] = None
+    txn_type: Optional[Literal["withdraw", "transfer"]] = None
+    user_id: Optional[str] = None
+    before: Optional[datetime] = None  # Only items logged before this time
+    limit: int = Field(default=1000, gt=0, le=10000)
+    # Run in a Celery worker and poll GET /transactions/pending/bulk/{job_id}
+    run_async: bool = False
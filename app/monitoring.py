@@ -0,0 +1,78 @@
+# monitoring.py
+import contextvars
+from typing import Dict, Optional
+
+from pymongo import monitoring
+
+MONGO_LATENCY_ALPHA = 0.2       # Weight of the newest sample in the moving average
+BASELINE_DRIFT = 0.001          # Share of the gap the baseline closes per sample when latency is above it
+BACKGROUND = "background"       # Tag for commands issued outside any request (jobs, aggregators)
+
+# Route class of the request issuing Mongo commands, set by the admission
+# middleware. Motor runs commands on its executor with a copy of the caller's
+# context, so the listener sees the value of the coroutine that issued them.
+route_class_var = contextvars.ContextVar("route_class", default=None)
+
+
+class LatencyStats:
+    """
+    Moving average of command latency (milliseconds) and a baseline: the
+    lowest average seen, drifting slowly up towards the current average so a
+    lasting shift (new hardware, bigger working set) is eventually accepted.
+    """
+
+    def __init__(self):
+        self.ewma_ms = 0.0
+        self.baseline_ms = 0.0
+        self.samples = 0
+
+    def record(self, duration_ms: float):
+        if self.samples == 0:
+            self.ewma_ms = self.baseline_ms = duration_ms
+        else:
+            self.ewma_ms += MONGO_LATENCY_ALPHA * (duration_ms - self.ewma_ms)
+            if self.ewma_ms < self.baseline_ms:
+                self.baseline_ms = self.ewma_ms
+            else:
+                self.baseline_ms += BASELINE_DRIFT * (self.ewma_ms - self.baseline_ms)
+        self.samples += 1
+
+    def snapshot(self) -> Dict:
+        return {"latency_ms": round(self.ewma_ms, 2), "baseline_ms": round(self.baseline_ms, 2),
+                "samples": self.samples}
+
+
+class MongoLatencyListener(monitoring.CommandListener):
+    """
+    Tracks MongoDB command latency for the client it is attached to, overall
+    and per route class (route_class_var), so one class's slow queries do not
+    read as load on the others.
+    """
+
+    def __init__(self):
+        self.overall = LatencyStats()
+        self.by_class = {}   # route class or BACKGROUND -> LatencyStats
+
+    def for_class(self, route_class: str) -> Optional[LatencyStats]:
+        return self.by_class.get(route_class)
+
+    def _record(self, duration_micros: int):
+        duration_ms = duration_micros / 1000
+        self.overall.record(duration_ms)
+        tag = route_class_var.get() or BACKGROUND
+        stats = self.by_class.get(tag)
+        if stats is None:
+            stats = self.by_class.setdefault(tag, LatencyStats())
+        stats.record(duration_ms)
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event.duration_micros)
+
+    def failed(self, event):
+        self._record(event.duration_micros)
+
+
+mongo_latency = MongoLatencyListener()
@@ -0,0 +1,207 @@
+# onboarding.py
+"""
+Bulk user/account import from CSV or NDJSON.
+
+CLI:
+    python -m app.onboarding customers.csv --create-accounts
+    python -m app.onboarding customers.ndjson --format ndjson
+CSV input needs a header row with name,email,password[,role].
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+from app.allocator import account_number_allocator
+from app.config import db_jobs
+from app.models import UserCreate
+from app.utils import hash_password
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))                   # Rows per insert_many
+IMPORT_HASH_WORKERS = int(os.getenv("IMPORT_HASH_WORKERS", str(os.cpu_count() or 2)))
+MAX_REPORTED_ERRORS = 1000
+
+_hash_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ProcessPoolExecutor(max_workers=IMPORT_HASH_WORKERS)
+    return _hash_pool
+
+
+def _hash_many(passwords: List[str]) -> List[str]:
+    return [hash_password(password) for password in passwords]
+
+
+async def _hash_passwords(passwords: List[str]) -> List[str]:
+    """bcrypt the passwords across the process pool, keeping input order."""
+    loop = asyncio.get_running_loop()
+    pool = _get_hash_pool()
+    size = max(1, -(-len(passwords) // IMPORT_HASH_WORKERS))
+    slices = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+    hashed = await asyncio.gather(*[loop.run_in_executor(pool, _hash_many, part) for part in slices])
+    return [value for part in hashed for value in part]
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *complete, buffer = buffer.split(b"\n")
+        for line in complete:
+            yield line.decode("utf-8").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8").rstrip("\r")
+
+
+async def parse_rows(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Dict]:
+    """
+    Stream rows out of CSV (header row first) or NDJSON input. Quoted CSV
+    fields must not contain newlines. Unparseable lines are yielded as
+    {"_error": ...} so they are reported with their row number.
+    """
+    header = None
+    async for line in _lines(chunks):
+        if not line.strip():
+            continue
+        if fmt == "ndjson":
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                row = {"_error": f"Invalid JSON: {exc}"}
+            yield row if isinstance(row, dict) else {"_error": "Expected a JSON object"}
+        elif header is None:
+            header = [column.strip() for column in next(csv.reader([line]))]
+        else:
+            values = next(csv.reader([line]))
+            if len(values) != len(header):
+                yield {"_error": f"Expected {len(header)} columns, got {len(values)}"}
+            else:
+                # Empty cells are treated as missing so optional columns keep their defaults
+                yield {key: value for key, value in zip(header, values) if value != ""}
+
+
+def _write_errors(exc: BulkWriteError) -> Dict[int, str]:
+    errors = {}
+    for error in exc.details["writeErrors"]:
+        errors[error["index"]] = "Duplicate key" if error["code"] == 11000 else error["errmsg"]
+    return errors
+
+
+async def _import_chunk(rows: List[Tuple[int, Dict]], create_accounts: bool, report: Dict):
+    valid = []
+    for row_number, row in rows:
+        if "_error" in row:
+            _add_error(report, row_number, row.get("email"), row["_error"])
+            continue
+        try:
+            valid.append((row_number, UserCreate(**row)))
+        except ValidationError as exc:
+            _add_error(report, row_number, row.get("email"), exc.errors()[0]["msg"])
+    if not valid:
+        return
+
+    hashed = await _hash_passwords([user.password for _, user in valid])
+    user_docs = [
+        {"_id": ObjectId(), "name": user.name, "email": user.email, "hashed_password": hashed_password, "role": user.role}
+        for (_, user), hashed_password in zip(valid, hashed)
+    ]
+    # The unique email index reports duplicates; other rows still go in.
+    failed = {}
+    try:
+        await db_jobs.users.insert_many(user_docs, ordered=False)
+    except BulkWriteError as exc:
+        failed = _write_errors(exc)
+    for index, error in failed.items():
+        message = "Email already registered" if error == "Duplicate key" else error
+        _add_error(report, valid[index][0], valid[index][1].email, message)
+    created = [(valid[i][0], doc) for i, doc in enumerate(user_docs) if i not in failed]
+    report["users_created"] += len(created)
+
+    if not create_accounts or not created:
+        return
+    account_docs = [
+        {
+            "user_id": str(doc["_id"]),
+            "account_number": await account_number_allocator.next_account_number(),
+            "balance": 0.0,
+            "locked": False,
+            "txn_version": 1
+        }
+        for _, doc in created
+    ]
+    failed = {}
+    try:
+        await db_jobs.accounts.insert_many(account_docs, ordered=False)
+    except BulkWriteError as exc:
+        failed = _write_errors(exc)
+    for index, error in failed.items():
+        _add_error(report, created[index][0], created[index][1]["email"], f"Account not created: {error}")
+    report["accounts_created"] += len(account_docs) - len(failed)
+
+
+def _add_error(report: Dict, row_number: int, email: Optional[str], message: str):
+    report["error_count"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append({"row": row_number, "email": email, "error": message})
+
+
+async def import_users(chunks: AsyncIterator[bytes], fmt: str = "csv", create_accounts: bool = True) -> Dict:
+    """
+    Stream rows from `chunks`, then validate, hash and insert them
+    IMPORT_CHUNK_SIZE at a time. Returns per-row errors (row numbers are
+    1-based data rows) and sustained throughput.
+    """
+    if fmt not in ["csv", "ndjson"]:
+        raise ValueError("Format must be 'csv' or 'ndjson'")
+    started = time.monotonic()
+    report = {"rows": 0, "users_created": 0, "accounts_created": 0, "error_count": 0, "errors": []}
+    pending = []
+    async for row in parse_rows(chunks, fmt):
+        report["rows"] += 1
+        pending.append((report["rows"], row))
+        if len(pending) == IMPORT_CHUNK_SIZE:
+            await _import_chunk(pending, create_accounts, report)
+            pending = []
+    if pending:
+        await _import_chunk(pending, create_accounts, report)
+
+    elapsed = time.monotonic() - started
+    report["elapsed_seconds"] = round(elapsed, 3)
+    report["rows_per_second"] = round(report["rows"] / elapsed, 1) if elapsed > 0 else None
+    return report
+
+
+async def _file_chunks(path: str, size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    with open(path, "rb") as handle:
+        while True:
+            chunk = handle.read(size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import users (and accounts) from CSV or NDJSON.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="Defaults to the file extension")
+    parser.add_argument("--create-accounts", action="store_true", help="Open a bank account for every new user")
+    args = parser.parse_args()
+
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    report = asyncio.run(import_users(_file_chunks(args.path), fmt, args.create_accounts))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
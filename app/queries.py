@@ -0,0 +1,101 @@
+# queries.py
+"""
+Transaction filters built by the routes and jobs. The index plan check
+(app/indexes.py) explains these same builders, so the indexes are checked
+against the queries that are actually issued.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+
+FRAUD_DEBIT_TYPES = ["withdraw", "transfer"]
+# Statuses that can still change stay in the hot tier regardless of age.
+UNSETTLED_STATUSES = ["pending", "processing"]
+
+
+def fraud_daily_filter(user_id: str, day_start: datetime, day_end: datetime) -> Dict:
+    """Successful debits today (check_fraud daily limit)."""
+    return {
+        "user_id": user_id,
+        "type": {"$in": FRAUD_DEBIT_TYPES},
+        "timestamp": {"$gte": day_start, "$lte": day_end},
+        "status": "success"
+    }
+
+
+def fraud_hourly_filter(user_id: str, since: datetime) -> Dict:
+    """Successful debits since `since` (check_fraud hourly frequency)."""
+    return {
+        "user_id": user_id,
+        "type": {"$in": FRAUD_DEBIT_TYPES},
+        "timestamp": {"$gte": since},
+        "status": "success"
+    }
+
+
+def fraud_recipient_filter(user_id: str, recipient_account: str, day_start: datetime, day_end: datetime) -> Dict:
+    """Successful transfers to one recipient today (check_fraud recipient rule)."""
+    return {
+        "user_id": user_id,
+        "type": "transfer",
+        "to_account": recipient_account,
+        "timestamp": {"$gte": day_start, "$lte": day_end},
+        "status": "success"
+    }
+
+
+def history_filter(user_id: str, txn_type: Optional[str] = None, status: Optional[str] = None,
+                   start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict:
+    """A user's transaction history, optionally by type, status and timestamp range."""
+    query = {"user_id": user_id}
+    if txn_type:
+        query["type"] = txn_type
+    if status:
+        query["status"] = status
+    if start or end:
+        query["timestamp"] = {}
+        if start:
+            query["timestamp"]["$gte"] = start
+        if end:
+            query["timestamp"]["$lte"] = end
+    return query
+
+
+def pending_filter(object_ids: Optional[List[ObjectId]] = None, txn_type: Optional[str] = None,
+                   user_id: Optional[str] = None, before: Optional[datetime] = None) -> Dict:
+    """Pending items (the /pending listing, or the candidates a bulk job claims)."""
+    query = {"status": "pending"}
+    if object_ids is not None:
+        query["_id"] = {"$in": object_ids}
+        return query
+    if txn_type:
+        query["type"] = txn_type
+    if user_id:
+        query["user_id"] = user_id
+    if before:
+        query["timestamp"] = {"$lt": before}
+    return query
+
+
+def claimed_filter(claim_id: str) -> Dict:
+    """Items a bulk job or single approval has claimed."""
+    return {"claim_id": claim_id, "status": "processing"}
+
+
+def archivable_filter(cutoff: datetime, settled_by: datetime) -> Dict:
+    """
+    Settled items logged before `cutoff`. Items approved after `settled_by`
+    are left out, so an archive run never moves anything settled later than
+    the settled_until it registered.
+    """
+    return {
+        "timestamp": {"$lt": cutoff},
+        "status": {"$nin": UNSETTLED_STATUSES},
+        "$or": [{"updated_at": None}, {"updated_at": {"$lte": settled_by}}],
+    }
+
+
+def touched_filter(since: datetime) -> Dict:
+    """Items logged or settled since `since` (incremental reconciliation)."""
+    return {"$or": [{"timestamp": {"$gte": since}}, {"updated_at": {"$gte": since}}]}
@@ -0,0 +1,152 @@
+# query_cache.py
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+from redis.exceptions import RedisError, ResponseError
+
+from app.cache import QUERY_CACHE_REDIS_URL, REDIS_URL, query_cache_redis_client as redis_client
+
+HISTORY_CACHE_TTL_SECONDS = 60             # Ranges that include today can still grow
+HISTORY_CACHE_CLOSED_TTL_SECONDS = 3600    # Ranges that ended before today
+HISTORY_CACHE_MAX_BYTES = 256 * 1024       # Larger results are not cached
+HISTORY_REPLICA_LAG_SECONDS = 120          # History reads may come from a lagging secondary
+LOCAL_CACHE_MAX_ENTRIES = 1024             # In-process LRU tier
+# e.g. "256mb"; caps the query cache Redis's memory and evicts
+# least-recently-used cache entries. Only applied when QUERY_CACHE_REDIS_URL
+# is a different server from REDIS_URL (the Celery broker).
+QUERY_CACHE_REDIS_MAXMEMORY = os.getenv("QUERY_CACHE_REDIS_MAXMEMORY")
+
+# Cached results live under the user's current history version, so bumping the
+# version invalidates all of them at once without scanning keys; entries under
+# old versions simply expire. Version keys have no TTL, and the Redis policy is
+# volatile-lru, so only cache entries are ever evicted and a version can never
+# fall back to an older value.
+#
+# The cache is best-effort: Redis errors are logged, never raised, since
+# callers run after money has already moved. A bump that fails leaves stale
+# entries until their TTL expires.
+_local_cache = OrderedDict()
+
+
+def _version_key(user_id: str) -> str:
+    return f"txn_hist_ver:{user_id}"
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _recent_change_key(user_id: str) -> str:
+    return f"txn_hist_changed:{user_id}"
+
+
+def _entry_key(user_id: str, version: str, query: Dict) -> str:
+    normalized = json.dumps(query, sort_keys=True, default=_encode)
+    digest = hashlib.sha1(normalized.encode()).hexdigest()[:20]
+    return f"txn_hist:{user_id}:v{version}:{digest}"
+
+
+def _local_get(key: str):
+    entry = _local_cache.get(key)
+    if not entry:
+        return None
+    expires_at, value = entry
+    if expires_at < time.monotonic():
+        del _local_cache[key]
+        return None
+    _local_cache.move_to_end(key)
+    return value
+
+
+def _local_set(key: str, value, ttl: int):
+    _local_cache[key] = (time.monotonic() + ttl, value)
+    _local_cache.move_to_end(key)
+    while len(_local_cache) > LOCAL_CACHE_MAX_ENTRIES:
+        _local_cache.popitem(last=False)
+
+
+def _server(url: str) -> (Optional[str], int):
+    parts = urlsplit(url)
+    return parts.hostname, parts.port or 6379
+
+
+async def configure_redis_memory():
+    if not QUERY_CACHE_REDIS_MAXMEMORY:
+        return
+    if _server(QUERY_CACHE_REDIS_URL) == _server(REDIS_URL):
+        # Eviction would also apply to Celery's queues and results.
+        print("QUERY_CACHE_REDIS_MAXMEMORY ignored: set QUERY_CACHE_REDIS_URL to a Redis separate from REDIS_URL")
+        return
+    try:
+        await redis_client.config_set("maxmemory", QUERY_CACHE_REDIS_MAXMEMORY)
+        await redis_client.config_set("maxmemory-policy", "volatile-lru")
+    except ResponseError as exc:
+        # Managed Redis often disallows CONFIG; the provider's policy applies.
+        print(f"Could not configure Redis memory limits: {exc}")
+    except RedisError as exc:
+        print(f"Query cache Redis unavailable, memory limits not set: {exc}")
+
+
+async def bump_history_versions(user_ids: Iterable[str]):
+    """Invalidate every cached history result of these users."""
+    user_ids = set(user_ids)
+    pipe = redis_client.pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.incr(_version_key(user_id))
+        pipe.set(_recent_change_key(user_id), 1, ex=HISTORY_REPLICA_LAG_SECONDS)
+    try:
+        await pipe.execute()
+    except RedisError as exc:
+        print(f"Could not invalidate cached history of {len(user_ids)} users: {exc}")
+
+
+async def bump_history_version(user_id: str):
+    await bump_history_versions([user_id])
+
+
+async def get_cached_history(user_id: str, query: Dict) -> (Optional[List[Dict]], str, bool):
+    """
+    Look up a cached history result for `query`. Returns (result or None,
+    entry key to store a fresh result under, whether the user's history
+    changed recently). Without Redis the key is None and nothing is cached.
+    """
+    try:
+        version, recently_changed = await redis_client.mget(_version_key(user_id), _recent_change_key(user_id))
+        key = _entry_key(user_id, version or "0", query)
+        cached = _local_get(key)
+        if cached is None:
+            raw = await redis_client.get(key)
+            if raw is not None:
+                cached = json.loads(raw)
+                _local_set(key, cached, HISTORY_CACHE_TTL_SECONDS)
+    except RedisError as exc:
+        print(f"History cache unavailable: {exc}")
+        return None, None, False
+    return cached, key, bool(recently_changed)
+
+
+async def cache_history(key: Optional[str], transactions: List[Dict], closed_range: bool, recently_changed: bool = False):
+    # Right after a change the secondary the result was read from may not
+    # have it yet, and caching it under the new version would hide the
+    # change until the entry expired. Such results are served uncached
+    # until replicas have caught up (HISTORY_REPLICA_LAG_SECONDS).
+    if key is None or recently_changed:
+        return
+    payload = json.dumps(transactions, default=_encode)
+    if len(payload) > HISTORY_CACHE_MAX_BYTES:
+        return
+    ttl = HISTORY_CACHE_CLOSED_TTL_SECONDS if closed_range else HISTORY_CACHE_TTL_SECONDS
+    try:
+        await redis_client.set(key, payload, ex=ttl)
+    except RedisError as exc:
+        print(f"Could not cache history result: {exc}")
+        return
+    _local_set(key, json.loads(payload), min(ttl, HISTORY_CACHE_TTL_SECONDS))
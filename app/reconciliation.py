@@ -0,0 +1,195 @@
+# reconciliation.py
+import asyncio
+import os
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from app.config import db_jobs
+from app.ledger import tiered_ledger_deltas
+from app.hot_accounts import pending_hot_credits
+from app.queries import touched_filter
+
+RECONCILE_PARTITIONS = int(os.getenv("RECONCILE_PARTITIONS", "16"))    # Account ranges per full run
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "4"))   # Aggregations in flight at once
+RECONCILE_CHUNK_SIZE = int(os.getenv("RECONCILE_CHUNK_SIZE", "500"))   # Accounts per incremental batch
+RECONCILE_RECHECK_DELAY_SECONDS = float(os.getenv("RECONCILE_RECHECK_DELAY_SECONDS", "5"))  # Wait before confirming a mismatch
+BALANCE_TOLERANCE = 0.005                                              # Float noise we ignore
+
+CHECKPOINT_ID = "balances"
+ACCOUNT_FIELDS = {"_id": 0, "user_id": 1, "account_number": 1, "balance": 1}
+
+
+async def _partition_ranges(partitions: int) -> List[Dict]:
+    """
+    Split accounts into contiguous account_number ranges of roughly equal size.
+    $bucketAuto makes every bucket's max the next bucket's min, so all ranges
+    are half-open except the last one, which includes its max.
+    """
+    buckets = await db_jobs.accounts.aggregate(
+        [{"$bucketAuto": {"groupBy": "$account_number", "buckets": partitions}}],
+        allowDiskUse=True
+    ).to_list(length=None)
+    ranges = []
+    for index, bucket in enumerate(buckets):
+        upper_op = "$lte" if index == len(buckets) - 1 else "$lt"
+        ranges.append({"account_number": {"$gte": bucket["_id"]["min"], upper_op: bucket["_id"]["max"]}})
+    return ranges
+
+
+async def _touched_account_filters(since: datetime) -> List[Dict]:
+    """
+    Account filters (in chunks) for accounts with transactions logged or
+    settled since `since`.
+    """
+    touched = touched_filter(since)
+    user_ids, recipients = await asyncio.gather(
+        db_jobs.transactions.distinct("user_id", touched),
+        db_jobs.transactions.distinct("to_account", {**touched, "type": "transfer"}),
+    )
+    accounts = await db_jobs.accounts.find(
+        {"$or": [{"user_id": {"$in": user_ids}}, {"account_number": {"$in": recipients}}]},
+        {"_id": 0, "account_number": 1}
+    ).to_list(length=None)
+    numbers = sorted(acc["account_number"] for acc in accounts)
+    return [
+        {"account_number": {"$in": numbers[i:i + RECONCILE_CHUNK_SIZE]}}
+        for i in range(0, len(numbers), RECONCILE_CHUNK_SIZE)
+    ]
+
+
+async def _compare(account_filter: Dict) -> (List[Dict], Dict[str, Dict]):
+    """
+    Read the accounts and their ledger. Returns the accounts and the
+    mismatches found, keyed by account_number.
+    """
+    accounts = await db_jobs.accounts.find(account_filter, ACCOUNT_FIELDS).to_list(length=None)
+    deltas, pending = await asyncio.gather(
+        tiered_ledger_deltas(accounts, database=db_jobs),
+        pending_hot_credits([acc["account_number"] for acc in accounts]),
+    )
+
+    mismatches = {}
+    for account in accounts:
+        ledger_balance = round(deltas.get(account["account_number"], 0.0), 2)
+        # Hot-account credits not yet folded into the stored balance still count.
+        balance = round(account["balance"] + pending.get(account["account_number"], 0.0), 2)
+        difference = round(balance - ledger_balance, 2)
+        if abs(difference) > BALANCE_TOLERANCE:
+            mismatches[account["account_number"]] = {
+                "account_number": account["account_number"],
+                "user_id": account["user_id"],
+                "balance": balance,
+                "ledger_balance": ledger_balance,
+                "difference": difference
+            }
+    return accounts, mismatches
+
+
+async def _check_partition(account_filter: Dict, semaphore: asyncio.Semaphore) -> Dict:
+    async with semaphore:
+        accounts, mismatches = await _compare(account_filter)
+
+    # Balances and the ledger are read at different moments, and a balance
+    # update always lands before its transaction log, so an in-flight
+    # transaction shows up as a mismatch. A mismatch is only recorded if the
+    # same difference is still there after a short delay. The balance itself
+    # may have moved (busy and hot accounts always do); completed
+    # transactions change both sides equally and leave real drift as it was.
+    discrepancies = []
+    settled = []
+    if mismatches:
+        await asyncio.sleep(RECONCILE_RECHECK_DELAY_SECONDS)
+        async with semaphore:
+            _, rechecked = await _compare({"account_number": {"$in": list(mismatches)}})
+        for number, first in mismatches.items():
+            again = rechecked.get(number)
+            if again is None:
+                settled.append(number)
+            elif again["difference"] == first["difference"]:
+                discrepancies.append(again)
+
+    clean = [acc["account_number"] for acc in accounts if acc["account_number"] not in mismatches] + settled
+    return {"checked": len(accounts), "discrepancies": discrepancies, "clean": clean}
+
+
+async def _record_results(run_id: str, detected_at: datetime, results: List[Dict]) -> int:
+    """
+    Keep one open discrepancy row per account (updated while it persists) and
+    mark open rows resolved once a run finds their account clean. Returns
+    the number of rows resolved.
+    """
+    discrepancies = [d for result in results for d in result["discrepancies"]]
+    if discrepancies:
+        await db_jobs.reconciliation_discrepancies.bulk_write([
+            UpdateOne(
+                {"account_number": d["account_number"], "resolved_at": None},
+                {"$set": {**d, "run_id": run_id, "last_seen_at": detected_at},
+                 "$setOnInsert": {"detected_at": detected_at}},
+                upsert=True
+            )
+            for d in discrepancies
+        ], ordered=False)
+
+    clean = [number for result in results for number in result["clean"]]
+    resolved = 0
+    for i in range(0, len(clean), RECONCILE_CHUNK_SIZE):
+        result = await db_jobs.reconciliation_discrepancies.update_many(
+            {"account_number": {"$in": clean[i:i + RECONCILE_CHUNK_SIZE]}, "resolved_at": None},
+            {"$set": {"resolved_at": datetime.utcnow(), "resolved_by_run": run_id}}
+        )
+        resolved += result.modified_count
+    return resolved
+
+
+async def reconcile(incremental: bool = True, partitions: Optional[int] = None) -> Dict:
+    """
+    Compare every account's balance with the sum of its successful transactions
+    and write a discrepancy report.
+
+    Full runs split accounts into account_number ranges; incremental runs only
+    re-check accounts touched since the last checkpoint (falling back to a full
+    run when there is none). Ranges are checked concurrently, each with two
+    server-side aggregations per transaction tier (hot and archived months).
+    """
+    started_at = datetime.utcnow()
+    run_id = str(uuid.uuid4())
+
+    checkpoint = await db_jobs.reconciliation_checkpoints.find_one({"_id": CHECKPOINT_ID})
+    if incremental and checkpoint:
+        mode = "incremental"
+        filters = await _touched_account_filters(checkpoint["last_checked_at"])
+    else:
+        mode = "full"
+        filters = await _partition_ranges(partitions or RECONCILE_PARTITIONS)
+
+    semaphore = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+    results = await asyncio.gather(*[_check_partition(f, semaphore) for f in filters])
+
+    discrepancies = [d for result in results for d in result["discrepancies"]]
+    resolved = await _record_results(run_id, started_at, results)
+
+    report = {
+        "run_id": run_id,
+        "mode": mode,
+        "started_at": started_at,
+        "finished_at": datetime.utcnow(),
+        "partitions": len(filters),
+        "accounts_checked": sum(result["checked"] for result in results),
+        "discrepancy_count": len(discrepancies),
+        "resolved_count": resolved
+    }
+    await db_jobs.reconciliation_reports.insert_one(dict(report))
+
+    # Checkpointing at the start means accounts that moved during this run
+    # (including mismatches skipped above) are re-checked by the next one.
+    await db_jobs.reconciliation_checkpoints.update_one(
+        {"_id": CHECKPOINT_ID},
+        {"$set": {"last_checked_at": started_at, "last_run_id": run_id}},
+        upsert=True
+    )
+    print(f"Reconciliation {run_id} ({mode}): {report['accounts_checked']} accounts, "
+          f"{len(discrepancies)} discrepancies, {resolved} resolved")
+    return report
@@ -1,16 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from app.config import db
-from app.utils import get_current_user
+from app.utils import get_current_user, use_db, require_roles
 from typing import List, Dict
+from datetime import datetime, timezone
 from bson import ObjectId  
-import random
+from pymongo.errors import DuplicateKeyError
+from app.allocator import account_number_allocator
+from app.archive import find_transactions
+from app.snapshots import balance_at
+from app.hot_accounts import effective_balance, set_hot
 
 router = APIRouter()
 
-# Helper function to generate a random 10-digit account number.
-def generate_account_number():
-    return str(random.randint(1000000000, 9999999999))
-
 def convert_objectids(item: Dict) -> Dict:
     """
     Recursively convert ObjectId fields in a dictionary to strings.
@@ -31,12 +32,8 @@ def convert_objectids(item: Dict) -> Dict:
 async def create_account(current_user: dict = Depends(get_current_user)):
     user_id = current_user["user_id"]
 
-    # Check if the user already has an account.
-    existing_account = await db.accounts.find_one({"user_id": user_id})
-    if existing_account:
-        raise HTTPException(status_code=400, detail="User already has an account")
-    
-    account_number = generate_account_number()
+    # Account numbers come from a locally reserved block (no DB hit per number).
+    account_number = await account_number_allocator.next_account_number()
     new_account = {
         "user_id": user_id,
         "account_number": account_number,
@@ -44,7 +41,19 @@ async def create_account(current_user: dict = Depends(get_current_user)):
         "locked": False,
         "txn_version": 1
     }
-    await db.accounts.insert_one(new_account)
+    # Atomic create-if-absent on user_id; the unique user_id index resolves
+    # concurrent upserts for the same user (on databases that predate it, run
+    # python -m app.indexes --unique-account-user-id).
+    try:
+        result = await db.accounts.update_one(
+            {"user_id": user_id},
+            {"$setOnInsert": new_account},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="User already has an account")
+    if result.upserted_id is None:
+        raise HTTPException(status_code=400, detail="User already has an account")
     return {"message": "Bank account created successfully", "account_number": account_number}
 
 # API to get account details.
@@ -56,19 +65,34 @@ async def get_account(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=404, detail="No account found")
     return {
         "account_number": account["account_number"],
-        "balance": account["balance"]
+        "balance": await effective_balance(account)
     }
+# API to get the account balance at a point in time.
+@router.get("/balance-at")
+async def get_balance_at(
+    current_user: dict = Depends(get_current_user),
+    ts: datetime = Query(..., description="Point in time (ISO 8601, UTC if no offset)")
+):
+    account = await db.accounts.find_one({"user_id": current_user["user_id"]})
+    if not account:
+        raise HTTPException(status_code=404, detail="No account found")
+    if ts.tzinfo:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return await balance_at(account, ts)
+
 @router.get("/details")
-async def account_details(current_user: dict = Depends(get_current_user)):
+async def account_details(current_user: dict = Depends(get_current_user), database=Depends(use_db("analytics"))):
     user_id = current_user["user_id"]
 
-    # Retrieve the user's account information
+    # Retrieve the user's account information from the primary, so the
+    # balance matches /bank/account and /transactions/balance
     account = await db.accounts.find_one({"user_id": user_id})
     if not account:
         raise HTTPException(status_code=404, detail="No account found")
     
-    # Retrieve all transactions for the user
-    transactions: List[Dict] = await db.transactions.find({"user_id": user_id}).to_list(length=None)
+    # Retrieve all transactions for the user (hot and archived); history
+    # tolerates replica lag
+    transactions: List[Dict] = await find_transactions({"user_id": user_id}, database)
     
     # Convert ObjectIds in account and transactions
     account = convert_objectids(account)
@@ -76,6 +100,13 @@ async def account_details(current_user: dict = Depends(get_current_user)):
     
     return {
         "account_number": account.get("account_number"),
-        "balance": account.get("balance"),
+        "balance": await effective_balance(account),
         "transactions": transactions
-    }
\ No newline at end of file
+    }
+
+# Admin API to flag/unflag a high fan-in (e.g. merchant) account for aggregated credits.
+@router.post("/hot-accounts/{account_number}", dependencies=[Depends(require_roles(["admin"]))])
+async def flag_hot_account(account_number: str, hot: bool = Query(True, description="Aggregate incoming credits")):
+    if not await set_hot(account_number, hot):
+        raise HTTPException(status_code=404, detail="Account not found")
+    return {"account_number": account_number, "hot": hot}
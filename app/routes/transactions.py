@@ -1,17 +1,26 @@
 from fastapi import APIRouter, Depends, HTTPException ,Request
 from app.config import db
 from app.models import TransactionRequest, TransactionLog
-from app.utils import get_current_user  ,log_audit_action
+from app.utils import get_current_user  ,log_audit_action, log_transaction, find_transaction_id_by_idempotency_key
 
 from datetime import datetime, timedelta
 
-from app.utils import require_roles
+from app.utils import require_roles, use_db
 from bson import ObjectId
+from bson.errors import InvalidId
 from app.models import TransferRequest
 from fastapi import Query ,Path
 from typing import Optional, Dict, List
-from app.tasks import send_email_notification  # Import the Celery task
+from app.tasks import send_email_notification, process_pending_bulk  # Import the Celery tasks
+from app.models import BulkPendingRequest
+from app.approvals import create_bulk_job, run_bulk_job, get_bulk_job, claim_pending_transaction, settle_claimed, approve_claimed
+from app.approvals import mark_funds_moving, list_stuck_claims, release_stuck_claims, resolve_stuck_claim
+from app.allocator import is_valid_account_number
+from app.archive import find_transactions
 from app.cache import redis_client  # import the redis client
+from app.query_cache import get_cached_history, cache_history
+from app.hot_accounts import credit_account, effective_balance
+from app.queries import fraud_daily_filter, fraud_hourly_filter, fraud_recipient_filter, history_filter, pending_filter
 router = APIRouter()
 
 
@@ -26,35 +35,21 @@ async def check_fraud(user_id: str, txn_type: str, amount: float, recipient_acco
     one_hour_ago = now - timedelta(hours=1)
 
     # 1. Daily total (only count successful withdrawals/transfers)
-    daily_txns = await db.transactions.find({
-        "user_id": user_id,
-        "type": {"$in": ["withdraw", "transfer"]},
-        "timestamp": {"$gte": today_start, "$lte": today_end},
-        "status": "success"
-    }).to_list(length=None)
+    daily_txns = await db.transactions.find(fraud_daily_filter(user_id, today_start, today_end)).to_list(length=None)
     daily_total = sum(txn["amount"] for txn in daily_txns)
     if daily_total + amount > 50000:
         return {"block": True, "reason": "Daily limit exceeded", "status": "blocked"}
 
     # 2. Hourly frequency check (count successful transactions in the last hour)
-    hourly_txns = await db.transactions.find({
-        "user_id": user_id,
-        "type": {"$in": ["withdraw", "transfer"]},
-        "timestamp": {"$gte": one_hour_ago},
-        "status": "success"
-    }).to_list(length=None)
+    hourly_txns = await db.transactions.find(fraud_hourly_filter(user_id, one_hour_ago)).to_list(length=None)
     if len(hourly_txns) >= 20:
         return {"block": True, "reason": "Hourly transaction frequency exceeded", "status": "blocked"}
 
     # 3. For transfers: check if more than 5 transfers to the same recipient today
     if txn_type == "transfer" and recipient_account:
-        transfers_to_recipient = await db.transactions.find({
-            "user_id": user_id,
-            "type": "transfer",
-            "to_account": recipient_account,
-            "timestamp": {"$gte": today_start, "$lte": today_end},
-            "status": "success"
-        }).to_list(length=None)
+        transfers_to_recipient = await db.transactions.find(
+            fraud_recipient_filter(user_id, recipient_account, today_start, today_end)
+        ).to_list(length=None)
         if len(transfers_to_recipient) >= 5:
             return {"block": True, "reason": "Too many transfers to this recipient today", "status": "blocked"}
 
@@ -70,9 +65,9 @@ async def deposit(transaction: TransactionRequest, request: Request, current_use
     user_id = current_user["user_id"]
 
     # Step 1: Check if transaction is already processed (Idempotency Key)
-    existing_txn = await db.transactions.find_one({"idempotency_key": transaction.idempotency_key})
-    if existing_txn:
-        return {"message": "Duplicate transaction ignored", "transaction_id": str(existing_txn["_id"])}
+    existing_txn_id = await find_transaction_id_by_idempotency_key(transaction.idempotency_key)
+    if existing_txn_id:
+        return {"message": "Duplicate transaction ignored", "transaction_id": str(existing_txn_id)}
 
     # Step 2: Add money atomically
     result = await db.accounts.update_one(
@@ -91,7 +86,7 @@ async def deposit(transaction: TransactionRequest, request: Request, current_use
             "idempotency_key": transaction.idempotency_key,
             "status": "failed"
         }
-        await db.transactions.insert_one(fail_txn_log)
+        await log_transaction(fail_txn_log)
         raise HTTPException(status_code=400, detail="Account not found or invalid ")
     # Retrieve the updated account to get the new balance.
     account = await db.accounts.find_one({"user_id": user_id})
@@ -106,7 +101,7 @@ async def deposit(transaction: TransactionRequest, request: Request, current_use
         "idempotency_key": transaction.idempotency_key ,
         "status": "success"  # Mark as successful
     }
-    await db.transactions.insert_one(txn_log)
+    await log_transaction(txn_log)
       # After logging the successful deposit transaction:
     await log_audit_action(request, user_id, "deposit", {"amount": transaction.amount, "idempotency_key": transaction.idempotency_key})
 
@@ -118,9 +113,9 @@ async def withdraw(transaction: TransactionRequest,  request: Request,current_us
     user_id = current_user["user_id"]
 
     # Step 1: Check for duplicate transactions (Idempotency Key)
-    existing_txn = await db.transactions.find_one({"idempotency_key": transaction.idempotency_key})
-    if existing_txn:
-        return {"message": "Duplicate transaction ignored", "transaction_id": str(existing_txn["_id"])}
+    existing_txn_id = await find_transaction_id_by_idempotency_key(transaction.idempotency_key)
+    if existing_txn_id:
+        return {"message": "Duplicate transaction ignored", "transaction_id": str(existing_txn_id)}
      # Fraud check for withdrawal (no recipient for withdrawals)
     fraud_result = await check_fraud(user_id, "withdraw", transaction.amount)
     if fraud_result.get("block"):
@@ -134,7 +129,7 @@ async def withdraw(transaction: TransactionRequest,  request: Request,current_us
             "idempotency_key": transaction.idempotency_key,
             "status": fraud_result["status"]
         }
-        await db.transactions.insert_one(txn_log)
+        await log_transaction(txn_log)
          # Log the fraud event in audit logs as well
         await log_audit_action(request, user_id, "withdraw_blocked", {"amount": transaction.amount, "reason": fraud_result["reason"]})
         raise HTTPException(status_code=400, detail=fraud_result["reason"])
@@ -149,7 +144,7 @@ async def withdraw(transaction: TransactionRequest,  request: Request,current_us
             "idempotency_key": transaction.idempotency_key,
             "status": fraud_result["status"]
         }
-        await db.transactions.insert_one(txn_log)
+        await log_transaction(txn_log)
         await log_audit_action(request, user_id, "withdraw_pending", {"amount": transaction.amount})
         return {"message": "Withdrawal pending admin approval"}
     # Step 2: Lock the account before withdrawing (Pessimistic Locking)
@@ -168,7 +163,7 @@ async def withdraw(transaction: TransactionRequest,  request: Request,current_us
             "idempotency_key": transaction.idempotency_key,
             "status": "failed"
         }
-        await db.transactions.insert_one(fail_txn_log)
+        await log_transaction(fail_txn_log)
         await log_audit_action(request, user_id, "withdraw_pending", {"amount": transaction.amount})
         raise HTTPException(status_code=400, detail="Insufficient balance or account locked")
 
@@ -195,7 +190,7 @@ async def withdraw(transaction: TransactionRequest,  request: Request,current_us
             "idempotency_key": transaction.idempotency_key,
             "status": "success"  # Mark as successful
         }
-        await db.transactions.insert_one(txn_log)
+        await log_transaction(txn_log)
         await log_audit_action(request, user_id, "withdraw_success", {"amount": transaction.amount})
   
     finally:
@@ -220,9 +215,9 @@ def convert_objectids(item):
     return item
 
 @router.get("/all-transactions")
-async def all_transactions(current_user: dict = Depends(require_roles(["admin"]))):
+async def all_transactions(current_user: dict = Depends(require_roles(["admin"])), database=Depends(use_db("analytics"))):
     # Only admin can see all transaction logs
-    transactions = await db.transactions.find().to_list(None)
+    transactions = await find_transactions({}, database)
     # Convert ObjectId fields to strings for JSON serialization
     transactions = [convert_objectids(txn) for txn in transactions]
     return {"transactions": transactions}
@@ -235,10 +230,14 @@ async def transfer_funds(
 ):
     sender_id = current_user["user_id"]
 
+    # Reject malformed recipient numbers before any database lookup.
+    if not is_valid_account_number(transfer.to_account):
+        raise HTTPException(status_code=400, detail="Invalid recipient account number")
+
     # Step 1: Check for duplicate transfer via idempotency key.
-    existing_txn = await db.transactions.find_one({"idempotency_key": transfer.idempotency_key})
-    if existing_txn:
-        return {"message": "Duplicate transaction ignored", "transaction_id": str(existing_txn["_id"])}
+    existing_txn_id = await find_transaction_id_by_idempotency_key(transfer.idempotency_key)
+    if existing_txn_id:
+        return {"message": "Duplicate transaction ignored", "transaction_id": str(existing_txn_id)}
     
 
     # Fraud check for transfer (including recipient-specific rules)
@@ -254,7 +253,7 @@ async def transfer_funds(
             "status": fraud_result["status"],
             "to_account": transfer.to_account
         }
-        await db.transactions.insert_one(txn_log)
+        await log_transaction(txn_log)
         await log_audit_action(request, sender_id, "transfer_blocked", {"amount": transfer.amount, "to_account": transfer.to_account})
         raise HTTPException(status_code=400, detail=fraud_result["reason"])
     if fraud_result.get("pending"):
@@ -269,7 +268,7 @@ async def transfer_funds(
             "status": fraud_result["status"],
             "to_account": transfer.to_account
         }
-        await db.transactions.insert_one(txn_log)
+        await log_transaction(txn_log)
         await log_audit_action(request, sender_id, "transfer_pending", {"amount": transfer.amount, "to_account": transfer.to_account})
         return {"message": "Transfer pending admin approval"}
     
@@ -304,12 +303,9 @@ async def transfer_funds(
         if debit_result.modified_count == 0:
             raise HTTPException(status_code=400, detail="Failed to debit sender account")
 
-        # Step 6: Credit recipient's account atomically.
-        credit_result = await db.accounts.update_one(
-            {"account_number": transfer.to_account},
-            {"$inc": {"balance": transfer.amount}}
-        )
-        if credit_result.modified_count == 0:
+        # Step 6: Credit recipient's account atomically (hot accounts get a ledger entry instead).
+        credited = await credit_account(transfer.to_account, transfer.amount, transfer.idempotency_key, recipient_account)
+        if not credited:
             # Rollback debit if credit fails.
             await db.accounts.update_one(
                 {"user_id": sender_id},
@@ -326,7 +322,7 @@ async def transfer_funds(
             "status": "failed",
              "to_account": transfer.to_account
     }
-            await db.transactions.insert_one(fail_txn_log)
+            await log_transaction(fail_txn_log)
             await log_audit_action(request, sender_id, "transfer_failed", {"amount": transfer.amount, "to_account": transfer.to_account})
             raise HTTPException(status_code=400, detail="Failed to credit recipient account")
 
@@ -341,7 +337,7 @@ async def transfer_funds(
             "to_account": transfer.to_account,
             "status":"success"  # Additional field for transfers
         }
-        await db.transactions.insert_one(txn_log)
+        await log_transaction(txn_log)
         await log_audit_action(request, sender_id, "transfer_success", {"amount": transfer.amount, "to_account": transfer.to_account})
         # **Trigger the email notification task** asynchronously.
         # For example, send an email to the sender notifying the transfer.
@@ -362,7 +358,8 @@ async def check_balance(current_user: dict = Depends(get_current_user)):
     account = await db.accounts.find_one({"user_id": user_id})
     if not account:
         raise HTTPException(status_code=404, detail="No account found")
-    return {"account_number": account["account_number"], "balance": account["balance"]}
+    # Includes credits to hot accounts that have not been folded in yet
+    return {"account_number": account["account_number"], "balance": await effective_balance(account)}
 
 @router.get("/")
 async def filter_transactions(
@@ -370,34 +367,33 @@ async def filter_transactions(
     txn_type: Optional[str] = Query(None, description="Filter by transaction type: deposit, withdraw, transfer"),
     status: Optional[str] = Query(None, description="Filter by transaction status: success, failed, blocked, pending"),
     start_date: Optional[str] = Query(None, description="Start date in YYYY-MM-DD"),
-    end_date: Optional[str] = Query(None, description="End date in YYYY-MM-DD")
+    end_date: Optional[str] = Query(None, description="End date in YYYY-MM-DD"),
+    database=Depends(use_db("analytics"))
 ):
-    # Only retrieve transactions for the logged-in user
-    query = {"user_id": current_user["user_id"]}
-    
-    if txn_type:
-        query["type"] = txn_type
-    if status:
-        query["status"] = status
+    start_dt = end_dt = None
     try:
-        if start_date and end_date:
+        if start_date:
             start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-            end_dt = datetime.strptime(end_date, "%Y-%m-%d")
+        if end_date:
             # Extend end_dt to cover the entire day (23:59:59)
-            end_dt = end_dt.replace(hour=23, minute=59, second=59)
-            query["timestamp"] = {"$gte": start_dt, "$lte": end_dt}
-        elif start_date:
-            start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-            query["timestamp"] = {"$gte": start_dt}
-        elif end_date:
-            end_dt = datetime.strptime(end_date, "%Y-%m-%d")
-            end_dt = end_dt.replace(hour=23, minute=59, second=59)
-            query["timestamp"] = {"$lte": end_dt}
+            end_dt = datetime.strptime(end_date, "%Y-%m-%d").replace(hour=23, minute=59, second=59)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
+    # Only retrieve transactions for the logged-in user
+    query = history_filter(current_user["user_id"], txn_type, status, start_dt, end_dt)
+
+    # Results are cached per normalized query under the user's history version
+    cached, cache_key, recently_changed = await get_cached_history(current_user["user_id"], query)
+    if cached is not None:
+        return {"transactions": cached}
     
-    transactions: List[Dict] = await db.transactions.find(query).to_list(length=None)
+    # Fans out to archived months when the date range reaches past the hot tier
+    transactions: List[Dict] = await find_transactions(query, database)
     transactions = [convert_objectids(txn) for txn in transactions]
+
+    today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    closed_range = bool(end_date) and end_dt < today_start
+    await cache_history(cache_key, transactions, closed_range, recently_changed)
     return {"transactions": transactions}
 
 
@@ -405,11 +401,83 @@ async def filter_transactions(
 #  For ADMIN to get all pending transaactions
 @router.get("/pending", dependencies=[Depends(require_roles(["admin"]))])
 async def list_pending_transactions():
-    pending_txns = await db.transactions.find({"status": "pending"}).to_list(length=None)
+    pending_txns = await db.transactions.find(pending_filter()).to_list(length=None)
     pending_txns = [convert_objectids(txn) for txn in pending_txns]
     return {"pending_transactions": pending_txns}
 
 
+# Bulk approve/reject pending transactions. Declared before /pending/{txn_id}
+# so "bulk" is not taken as a transaction id.
+@router.post("/pending/bulk")
+async def process_pending_bulk_transactions(
+    bulk: BulkPendingRequest,
+    request: Request,
+    current_user: dict = Depends(require_roles(["admin"]))
+):
+    if not bulk.txn_ids and not (bulk.txn_type or bulk.user_id or bulk.before):
+        raise HTTPException(status_code=400, detail="Provide txn_ids or at least one filter (txn_type, user_id, before).")
+    if bulk.txn_ids and len(bulk.txn_ids) > bulk.limit:
+        raise HTTPException(status_code=400, detail=f"At most {bulk.limit} txn_ids per job (raise limit, up to 10000).")
+
+    job_id = await create_bulk_job(current_user["user_id"], bulk.dict(exclude={"run_async"}))
+    if bulk.run_async:
+        process_pending_bulk.delay(job_id, request.client.host)
+        return {"message": "Bulk job queued", "job_id": job_id}
+
+    job = await run_bulk_job(job_id, request.client.host)
+    return {"message": "Bulk job completed", "job": job}
+
+
+@router.get("/pending/bulk/{job_id}", dependencies=[Depends(require_roles(["admin"]))])
+async def get_pending_bulk_job(job_id: str):
+    job = await get_bulk_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Bulk job not found")
+    return {"job": job}
+
+
+# Items a crashed bulk job or single approval left in "processing".
+# Filter by claim_id (a bulk job's id) to see one job's leftovers.
+@router.get("/processing/stuck", dependencies=[Depends(require_roles(["admin"]))])
+async def list_stuck_transactions(claim_id: Optional[str] = Query(None)):
+    stuck = await list_stuck_claims(claim_id)
+    return {"stuck_transactions": [convert_objectids(txn) for txn in stuck]}
+
+
+# Put a stuck claim's items whose funds never started moving back to pending.
+@router.post("/processing/stuck/release")
+async def release_stuck_transactions(
+    request: Request,
+    claim_id: str = Query(..., description="Bulk job id or claim id of the stuck items"),
+    current_user: dict = Depends(require_roles(["admin"]))
+):
+    released = await release_stuck_claims(claim_id)
+    await log_audit_action(request, current_user["user_id"], "stuck_claim_released", {"claim_id": claim_id, "released": released})
+    return {"released": released}
+
+
+# Settle a stuck item after checking whether its funds moved.
+@router.post("/processing/stuck/{txn_id}")
+async def resolve_stuck_transaction(
+    txn_id: str,
+    request: Request,
+    status: str = Query(..., description="Final status: success (funds moved) or failed (they did not)"),
+    current_user: dict = Depends(require_roles(["admin"]))
+):
+    if status not in ["success", "failed"]:
+        raise HTTPException(status_code=400, detail="Status must be either 'success' or 'failed'.")
+    try:
+        object_id = ObjectId(txn_id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Stuck transaction not found")
+    txn = await resolve_stuck_claim(object_id, status)
+    if not txn:
+        raise HTTPException(status_code=404, detail="Stuck transaction not found")
+    await log_audit_action(request, txn["user_id"], f"stuck_{txn['type']}_resolved",
+                           {"txn_id": txn_id, "status": status, "resolved_by": current_user["user_id"]})
+    return {"message": f"Transaction marked {status}"}
+
+
 @router.post("/pending/{txn_id}" )
 async def process_pending_transaction(
     txn_id: str,
@@ -418,61 +486,32 @@ async def process_pending_transaction(
     
     current_user: dict = Depends(require_roles(["admin"]))
 ):
-    # Find the pending transaction by its ObjectId
-    pending_txn = await db.transactions.find_one({"_id": ObjectId(txn_id), "status": "pending"})
-    if not pending_txn:
-        raise HTTPException(status_code=404, detail="Pending transaction not found")
-
     if action not in ["approve", "reject"]:
         raise HTTPException(status_code=400, detail="Action must be either 'approve' or 'reject'.")
+    try:
+        object_id = ObjectId(txn_id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Pending transaction not found")
+
+    # Claim the item (pending -> processing) so a bulk job or another admin
+    # cannot approve it at the same time
+    claim_id = str(ObjectId())
+    pending_txn = await claim_pending_transaction(object_id, claim_id)
+    if not pending_txn:
+        raise HTTPException(status_code=404, detail="Pending transaction not found")
 
     if action == "reject":
-        await db.transactions.update_one({"_id": ObjectId(txn_id)}, {"$set": {"status": "failed"}})
+        await settle_claimed(pending_txn, claim_id, "failed")
         await log_audit_action(request, pending_txn["user_id"], "pending_rejected", {"txn_id": txn_id})
         return {"message": "Transaction rejected"}
 
     # If approving, then perform the funds movement based on transaction type
-    txn_type = pending_txn["type"]
-    if txn_type == "withdraw":
-        user_id = pending_txn["user_id"]
-        # Check if sufficient funds now exist
-        account = await db.accounts.find_one({"user_id": user_id})
-        if not account or account["balance"] < pending_txn["amount"]:
-            await db.transactions.update_one({"_id": ObjectId(txn_id)}, {"$set": {"status": "failed"}})
-            raise HTTPException(status_code=400, detail="Insufficient funds at approval time")
-        # Deduct the funds
-        debit_result = await db.accounts.update_one({"user_id": user_id}, {"$inc": {"balance": -pending_txn["amount"]}})
-        if debit_result.modified_count == 0:
-            await db.transactions.update_one({"_id": ObjectId(txn_id)}, {"$set": {"status": "failed"}})
-            raise HTTPException(status_code=400, detail="Failed to debit funds on approval")
-        # Mark as approved (success)
-        await db.transactions.update_one({"_id": ObjectId(txn_id)}, {"$set": {"status": "success"}})
-        await log_audit_action(request, user_id, "pending_withdraw_approved", {"txn_id": txn_id})
-        return {"message": "Withdrawal approved and funds deducted"}
-    
-    elif txn_type == "transfer":
-        sender_id = pending_txn["user_id"]
-        recipient_account_number = pending_txn.get("to_account")
-        # Check sender account
-        sender_account = await db.accounts.find_one({"user_id": sender_id})
-        if not sender_account or sender_account["balance"] < pending_txn["amount"]:
-            await db.transactions.update_one({"_id": ObjectId(txn_id)}, {"$set": {"status": "failed"}})
-            raise HTTPException(status_code=400, detail="Insufficient funds for transfer at approval time")
-        # Debit sender
-        debit_result = await db.accounts.update_one({"user_id": sender_id}, {"$inc": {"balance": -pending_txn["amount"]}})
-        if debit_result.modified_count == 0:
-            await db.transactions.update_one({"_id": ObjectId(txn_id)}, {"$set": {"status": "failed"}})
-            raise HTTPException(status_code=400, detail="Failed to debit sender on approval")
-        # Credit recipient
-        credit_result = await db.accounts.update_one({"account_number": recipient_account_number}, {"$inc": {"balance": pending_txn["amount"]}})
-        if credit_result.modified_count == 0:
-            # Rollback debit
-            await db.accounts.update_one({"user_id": sender_id}, {"$inc": {"balance": pending_txn["amount"]}})
-            await db.transactions.update_one({"_id": ObjectId(txn_id)}, {"$set": {"status": "failed"}})
-            raise HTTPException(status_code=400, detail="Failed to credit recipient on approval")
-        # Mark as approved (success)
-        await db.transactions.update_one({"_id": ObjectId(txn_id)}, {"$set": {"status": "success"}})
-        await log_audit_action(request, sender_id, "pending_transfer_approved", {"txn_id": txn_id})
-        return {"message": "Transfer approved; funds debited and credited"}
-    else:
-        raise HTTPException(status_code=400, detail="Unsupported transaction type for approval")
\ No newline at end of file
+    await mark_funds_moving([object_id], claim_id)
+    outcome, detail = await approve_claimed(pending_txn)
+    if outcome != "success":
+        await settle_claimed(pending_txn, claim_id, "failed")
+        raise HTTPException(status_code=400, detail=detail)
+    # Mark as approved (success)
+    await settle_claimed(pending_txn, claim_id, "success")
+    await log_audit_action(request, pending_txn["user_id"], f"pending_{pending_txn['type']}_approved", {"txn_id": txn_id})
+    return {"message": detail}
@@ -1,13 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
 from app.models import UserCreate, UserResponse, UserDB
 from app.utils import hash_password, verify_password, create_jwt_token , log_audit_action
+from app.utils import audit_from_compact, AUDIT_COLLECTION
 from app.config import db
-from app.utils import require_roles
+from app.utils import require_roles, use_db
 from bson import ObjectId
 from typing import  Dict
 from datetime import datetime, timedelta
 from app.cache import redis_client  
 import json
+from app.onboarding import import_users
 
 router = APIRouter()
 
@@ -105,7 +107,7 @@ async def login(user: UserCreate ,request: Request):
 
 
 @router.get("/audit-logs", dependencies=[Depends(require_roles(["admin"]))])
-async def get_audit_logs():
+async def get_audit_logs(database=Depends(use_db("analytics"))):
     cache_key = "audit_logs"
     
     # Try to get audit logs from Redis cache
@@ -116,11 +118,28 @@ async def get_audit_logs():
         return {"audit_logs": logs}
     
     # If not cached, fetch from MongoDB
-    logs = await db.audit_logs.find().to_list(length=None)
-    # Convert ObjectId fields to strings
-    logs = [convert_objectids(log) for log in logs]
+    docs = await database[AUDIT_COLLECTION].find().sort("t", -1).to_list(length=None)
+    # Expand the compact time-series documents, then convert ObjectId/datetime fields to strings
+    logs = [convert_objectids({"_id": doc["_id"], **audit_from_compact(doc).dict()}) for doc in docs]
     
     # Cache the logs as a JSON string with a TTL of 100 seconds
     await redis_client.set(cache_key, json.dumps(logs), ex=100)
     
-    return {"audit_logs": logs}
\ No newline at end of file
+    return {"audit_logs": logs}
+
+
+# Bulk onboarding: stream CSV (header: name,email,password[,role]) or NDJSON in the request body
+@router.post("/bulk-import")
+async def bulk_import(
+    request: Request,
+    format: str = Query("csv", description="Input format: csv or ndjson"),
+    create_accounts: bool = Query(True, description="Open a bank account for every new user"),
+    current_user: dict = Depends(require_roles(["admin"]))
+):
+    if format not in ["csv", "ndjson"]:
+        raise HTTPException(status_code=400, detail="Format must be 'csv' or 'ndjson'")
+    report = await import_users(request.stream(), format, create_accounts)
+    await log_audit_action(request, current_user["user_id"], "bulk_import", {
+        "rows": report["rows"], "users_created": report["users_created"], "error_count": report["error_count"]
+    })
+    return report
@@ -0,0 +1,114 @@
+# snapshots.py
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from app.config import db, db_jobs
+from app.ledger import tiered_ledger_deltas
+from app.hot_accounts import pending_hot_credits
+
+SNAPSHOT_CHUNK_SIZE = int(os.getenv("SNAPSHOT_CHUNK_SIZE", "500"))     # Accounts per snapshot batch
+SNAPSHOT_CONCURRENCY = int(os.getenv("SNAPSHOT_CONCURRENCY", "4"))     # Batches in flight at once
+
+ACCOUNT_FIELDS = {"_id": 0, "user_id": 1, "account_number": 1, "balance": 1}
+
+
+def day_boundary(timestamp: datetime) -> datetime:
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+async def _latest_snapshots(account_numbers: List[str], before: datetime) -> Dict[str, Dict]:
+    rows = await db_jobs.balance_snapshots.aggregate([
+        {"$match": {"account_number": {"$in": account_numbers}, "ts": {"$lt": before}}},
+        {"$sort": {"account_number": 1, "ts": -1}},
+        {"$group": {"_id": "$account_number", "ts": {"$first": "$ts"}, "balance": {"$first": "$balance"}}}
+    ]).to_list(length=None)
+    return {row["_id"]: row for row in rows}
+
+
+async def _snapshot_chunk(accounts: List[Dict], boundary: datetime, semaphore: asyncio.Semaphore) -> int:
+    async with semaphore:
+        previous = await _latest_snapshots([acc["account_number"] for acc in accounts], boundary)
+
+        # Accounts with an earlier snapshot roll it forward with the ledger
+        # between the two boundaries (grouped by that snapshot's time).
+        # Accounts without one work back from the current balance.
+        by_previous_ts = {}
+        first_time = []
+        for account in accounts:
+            snapshot = previous.get(account["account_number"])
+            if snapshot:
+                by_previous_ts.setdefault(snapshot["ts"], []).append(account)
+            else:
+                first_time.append(account)
+
+        balances = {}
+        for previous_ts, group in by_previous_ts.items():
+            deltas = await tiered_ledger_deltas(group, start=previous_ts, end=boundary, database=db_jobs)
+            for account in group:
+                number = account["account_number"]
+                balances[number] = previous[number]["balance"] + deltas[number]
+        if first_time:
+            deltas, pending = await asyncio.gather(
+                tiered_ledger_deltas(first_time, start=boundary, database=db_jobs),
+                pending_hot_credits([acc["account_number"] for acc in first_time]),
+            )
+            for account in first_time:
+                number = account["account_number"]
+                balances[number] = account["balance"] + pending.get(number, 0.0) - deltas[number]
+
+        await db_jobs.balance_snapshots.bulk_write([
+            UpdateOne(
+                {"account_number": number, "ts": boundary},
+                {"$set": {"balance": round(balance, 2), "taken_at": datetime.utcnow()}},
+                upsert=True
+            )
+            for number, balance in balances.items()
+        ], ordered=False)
+    return len(balances)
+
+
+async def take_snapshots(boundary: Optional[datetime] = None) -> Dict:
+    """
+    Write one balance snapshot per account at `boundary` (default: the most
+    recent UTC midnight). Re-running for the same boundary overwrites it.
+    """
+    boundary = boundary or day_boundary(datetime.utcnow())
+    semaphore = asyncio.Semaphore(SNAPSHOT_CONCURRENCY)
+    pending = []
+    chunk = []
+    async for account in db_jobs.accounts.find({}, ACCOUNT_FIELDS).sort("account_number", 1):
+        chunk.append(account)
+        if len(chunk) == SNAPSHOT_CHUNK_SIZE:
+            pending.append(asyncio.create_task(_snapshot_chunk(chunk, boundary, semaphore)))
+            chunk = []
+    if chunk:
+        pending.append(asyncio.create_task(_snapshot_chunk(chunk, boundary, semaphore)))
+    written = sum(await asyncio.gather(*pending))
+
+    print(f"Wrote {written} balance snapshots at {boundary.isoformat()}")
+    return {"boundary": boundary.isoformat(), "snapshots": written}
+
+
+async def balance_at(account: Dict, ts: datetime) -> Dict:
+    """
+    Balance of `account` at `ts`: the nearest snapshot at or before `ts` plus
+    the ledger between the snapshot and `ts`. Without a snapshot the ledger
+    is replayed from the start (accounts open with a zero balance).
+    """
+    snapshot = await db.balance_snapshots.find_one(
+        {"account_number": account["account_number"], "ts": {"$lte": ts}},
+        sort=[("ts", -1)]
+    )
+    base = snapshot["balance"] if snapshot else 0.0
+    since = snapshot["ts"] if snapshot else None
+    deltas = await tiered_ledger_deltas([account], start=since, end=ts)
+    return {
+        "account_number": account["account_number"],
+        "ts": ts,
+        "balance": round(base + deltas[account["account_number"]], 2),
+        "snapshot_ts": since
+    }
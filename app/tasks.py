@@ -1,8 +1,57 @@
 # tasks.py
+import asyncio
 from .celery_app import celery_app
+from app.reconciliation import reconcile
+from app.approvals import run_bulk_job
+from app.archive import archive_transactions as archive_old_transactions
+from app.snapshots import take_snapshots
+from app.hot_accounts import drain_aggregators, release_stale_batches
+
+# Celery tasks are synchronous; Motor needs an event loop. Each worker process
+# keeps one loop so the shared Motor client stays bound to the same loop.
+_worker_loop = None
+
+def run_async(coro):
+    global _worker_loop
+    if _worker_loop is None:
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+    return _worker_loop.run_until_complete(coro)
 
 @celery_app.task
 def send_email_notification(user_email: str, subject: str, body: str):
     # For prototyping, just print the message
     print(f"Simulated Email: To: {user_email}, Subject: {subject}, Body: {body}")
     return f"Email sent to {user_email}"
+
+@celery_app.task
+def reconcile_balances(incremental: bool = True):
+    report = run_async(reconcile(incremental=incremental))
+    report["started_at"] = report["started_at"].isoformat()
+    report["finished_at"] = report["finished_at"].isoformat()
+    return report
+
+@celery_app.task
+def process_pending_bulk(job_id: str, ip_address: str = None):
+    try:
+        job = run_async(run_bulk_job(job_id, ip_address))
+    finally:
+        # Fold in credits to hot accounts before the worker loop goes idle,
+        # also when the job failed part-way
+        run_async(drain_aggregators())
+    return {"job_id": job_id, "status": job["status"], "processed": job["processed"], "counts": job["counts"]}
+
+@celery_app.task
+def archive_transactions(horizon_days: int = None):
+    return run_async(archive_old_transactions(horizon_days))
+
+@celery_app.task
+def snapshot_balances():
+    return run_async(take_snapshots())
+
+@celery_app.task
+def release_hot_credit_batches():
+    report = run_async(release_stale_batches())
+    # Apply the pending credits here rather than leaving them to the next task
+    run_async(drain_aggregators())
+    return report
@@ -1,3 +1,5 @@
+import asyncio
+from bson import ObjectId
 from passlib.context import CryptContext
 from fastapi import HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
@@ -5,10 +7,12 @@ from jose import jwt, JWTError
 import os
 from app.config import JWT_SECRET, JWT_ALGORITHM  # Import directly
 from datetime import datetime
-from app.config import db  # Make sure db is your Motor client
+from app.config import db, db_handles  # Make sure db is your Motor client
 from typing import Optional, Dict
 from typing import List
 from fastapi import Request
+from app.query_cache import bump_history_version
+from app.models import AuditLog
 
 # Password Hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -62,13 +66,66 @@ def require_roles(allowed_roles: List[str]):
             raise HTTPException(status_code=401, detail="Invalid token")
     return role_checker
 
+# Audit events live in a time-series collection (see app/audit_store.py) using
+# compact field names: t=timestamp, m=meta {u=user_id, a=action},
+# ip=ip_address, d=details. ip and d are left out when empty.
+AUDIT_COLLECTION = "audit_events"
+
+def audit_to_compact(entry: AuditLog) -> Dict:
+    doc = {"t": entry.timestamp, "m": {"u": entry.user_id, "a": entry.action}}
+    if entry.ip_address:
+        doc["ip"] = entry.ip_address
+    if entry.details:
+        doc["d"] = entry.details
+    return doc
+
+def audit_from_compact(doc: Dict) -> AuditLog:
+    return AuditLog(
+        user_id=doc["m"]["u"],
+        action=doc["m"]["a"],
+        timestamp=doc["t"],
+        ip_address=doc.get("ip"),
+        details=doc.get("d", {})
+    )
+
+def build_audit_entry(user_id: str, action: str, ip_address: Optional[str] = None, details: Optional[Dict] = None) -> Dict:
+    entry = AuditLog(user_id=user_id, action=action, timestamp=datetime.utcnow(), ip_address=ip_address, details=details or {})
+    return audit_to_compact(entry)
+
+def use_db(handle: str):
+    """
+    Dependency that gives a route a named database handle (see config.DB_HANDLE_SETTINGS).
+    Usage:
+      database = Depends(use_db("analytics"))
+    """
+    database = db_handles[handle]
+    def get_db():
+        return database
+    return get_db
+
+async def find_transaction_id_by_idempotency_key(idempotency_key: str) -> Optional[ObjectId]:
+    """
+    Id of the transaction already logged under this idempotency key. Recent
+    transactions are in the hot tier; archived ones are found through
+    idempotency_keys, which the archive job fills before rows leave the hot tier.
+    """
+    hot, retained = await asyncio.gather(
+        db.transactions.find_one({"idempotency_key": idempotency_key}, {"_id": 1}),
+        db.idempotency_keys.find_one({"_id": idempotency_key}),
+    )
+    if hot:
+        return hot["_id"]
+    if retained:
+        return retained["txn_id"]
+    return None
+
+async def log_transaction(txn_log: Dict):
+    """Insert a transaction log and invalidate the owner's cached history."""
+    result = await db.transactions.insert_one(txn_log)
+    await bump_history_version(txn_log["user_id"])
+    return result
+
 async def log_audit_action(request: Request, user_id: str, action: str, details: Optional[Dict] = None):
     ip_address = request.client.host  # Get client IP address
-    audit_entry = {
-        "user_id": user_id,
-        "action": action,
-        "timestamp": datetime.utcnow(),
-        "ip_address": ip_address,
-        "details": details or {}
-    }
-    await db.audit_logs.insert_one(audit_entry)
\ No newline at end of file
+    audit_entry = build_audit_entry(user_id, action, ip_address, details)
+    await db[AUDIT_COLLECTION].insert_one(audit_entry)
\ No newline at end of file
@@ -0,0 +1,115 @@
+# audit_storage.py
+"""
+Audit log storage: legacy documents in a regular collection vs compact
+documents in a time-series collection.
+
+    python -m benchmarks.audit_storage                # BSON bytes per entry only
+    python -m benchmarks.audit_storage --mongo        # also insert throughput and on-disk size
+
+--mongo writes to a scratch database (banking_bench) on MONGO_URI and drops it
+afterwards.
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+
+import bson
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.config import MONGO_URI
+from app.models import AuditLog
+from app.utils import audit_to_compact
+
+SAMPLE_ACTIONS = [
+    ("login", lambda: {"email": f"user{random.randint(1, 10000)}@example.com"}),
+    ("deposit", lambda: {"amount": round(random.uniform(1, 5000), 2), "idempotency_key": f"key-{random.getrandbits(64):x}"}),
+    ("withdraw_success", lambda: {"amount": round(random.uniform(1, 5000), 2)}),
+    ("transfer_success", lambda: {"amount": round(random.uniform(1, 5000), 2), "to_account": str(random.randint(10**9, 10**10 - 1))}),
+    ("login_failed", lambda: {"failed_attempts": random.randint(1, 5)}),
+]
+
+
+def sample_entries(count: int):
+    start = datetime.utcnow() - timedelta(days=1)
+    entries = []
+    for i in range(count):
+        action, details = random.choice(SAMPLE_ACTIONS)
+        entries.append(AuditLog(
+            user_id=str(bson.ObjectId()),
+            action=action,
+            timestamp=start + timedelta(milliseconds=i * 50),
+            ip_address=f"10.0.{random.randint(0, 255)}.{random.randint(0, 255)}",
+            details=details()
+        ))
+    return entries
+
+
+def legacy_doc(entry: AuditLog) -> dict:
+    return {
+        "user_id": entry.user_id,
+        "action": entry.action,
+        "timestamp": entry.timestamp,
+        "ip_address": entry.ip_address,
+        "details": entry.details or {}
+    }
+
+
+def bytes_per_entry(entries):
+    legacy = sum(len(bson.encode(legacy_doc(e))) for e in entries) / len(entries)
+    compact = sum(len(bson.encode(audit_to_compact(e))) for e in entries) / len(entries)
+    return legacy, compact
+
+
+async def insert_throughput(collection, docs, concurrency: int) -> float:
+    """Entries/sec for one insert_one per entry, `concurrency` in flight (like log_audit_action)."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def insert(doc):
+        async with semaphore:
+            await collection.insert_one(doc)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[insert(dict(doc)) for doc in docs])
+    return len(docs) / (time.perf_counter() - started)
+
+
+async def run_mongo(entries, concurrency: int):
+    client = AsyncIOMotorClient(MONGO_URI)
+    bench = client.banking_bench
+    await client.drop_database("banking_bench")
+    try:
+        await bench.create_collection("audit_legacy")
+        await bench.create_collection("audit_ts", timeseries={"timeField": "t", "metaField": "m", "granularity": "seconds"})
+        legacy_rate = await insert_throughput(bench.audit_legacy, [legacy_doc(e) for e in entries], concurrency)
+        compact_rate = await insert_throughput(bench.audit_ts, [audit_to_compact(e) for e in entries], concurrency)
+
+        sizes = {}
+        for name in ["audit_legacy", "audit_ts"]:
+            stats = await bench.command("collStats", name)
+            sizes[name] = (stats.get("storageSize", 0) + stats.get("totalIndexSize", 0)) / len(entries)
+        return legacy_rate, compact_rate, sizes
+    finally:
+        await client.drop_database("banking_bench")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--mongo", action="store_true", help="Measure inserts and storage against MONGO_URI")
+    args = parser.parse_args()
+
+    entries = sample_entries(args.entries)
+    legacy, compact = bytes_per_entry(entries)
+    print(f"BSON bytes/entry      legacy={legacy:8.1f}  compact={compact:8.1f}  ({compact / legacy:.0%})")
+
+    if args.mongo:
+        legacy_rate, compact_rate, sizes = asyncio.run(run_mongo(entries, args.concurrency))
+        print(f"inserts/sec           legacy={legacy_rate:8.0f}  timeseries={compact_rate:8.0f}")
+        print(f"stored bytes/entry    legacy={sizes['audit_legacy']:8.1f}  timeseries={sizes['audit_ts']:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# hot_account_fanin.py
+"""
+Recipient-side throughput under fan-in: many concurrent credits to one
+account, as direct $inc updates (the regular path) vs hot-account ledger
+entries folded in by the aggregator.
+
+    HOT_BENCH_MONGO_URI=mongodb://localhost:27017 python -m benchmarks.hot_account_fanin --credits 20000 --concurrency 200
+
+Runs against a scratch database (never the configured one): HOT_BENCH_DB on
+HOT_BENCH_MONGO_URI, dropped afterwards. Redis is still REDIS_URL. The hot
+path needs a replica set (the aggregator applies batches in a transaction),
+e.g. the docker-compose.replset.yml profile.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+load_dotenv(os.getenv("ENV_FILE", ".env"))
+
+HOT_BENCH_MONGO_URI = os.getenv("HOT_BENCH_MONGO_URI", "mongodb://localhost:27017")
+HOT_BENCH_DB = os.getenv("HOT_BENCH_DB", "banking_hot_bench")
+APP_MONGO_DB = os.getenv("MONGO_DB", "banking")
+
+
+async def _fan_in(credit, credits: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await credit(i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(credits)])
+    return time.perf_counter() - started
+
+
+async def run(credits: int, concurrency: int) -> int:
+    # Imported here: app.config connects to MONGO_URI/MONGO_DB, which main()
+    # points at the scratch database first.
+    from app.config import db
+    from app.hot_accounts import credit_account, drain_aggregators
+
+    if db.name != HOT_BENCH_DB:
+        print(f"Connected to {db.name}, expected the scratch database {HOT_BENCH_DB}; aborting")
+        return 1
+
+    direct_number = f"bench-direct-{uuid.uuid4().hex[:8]}"
+    hot_number = f"bench-hot-{uuid.uuid4().hex[:8]}"
+    await db.accounts.insert_many([
+        {"user_id": f"bench-{uuid.uuid4()}", "account_number": direct_number, "balance": 0.0, "locked": False, "txn_version": 1},
+        {"user_id": f"bench-{uuid.uuid4()}", "account_number": hot_number, "balance": 0.0, "locked": False, "txn_version": 1, "hot": True},
+    ])
+    hot_account = {"account_number": hot_number, "hot": True}
+    try:
+        async def direct_credit(i):
+            await db.accounts.update_one({"account_number": direct_number}, {"$inc": {"balance": 1.0}})
+
+        async def hot_credit(i):
+            await credit_account(hot_number, 1.0, f"bench-{i}", hot_account)
+
+        direct_seconds = await _fan_in(direct_credit, credits, concurrency)
+        hot_accept_seconds = await _fan_in(hot_credit, credits, concurrency)
+        started_drain = time.perf_counter()
+        await drain_aggregators()
+        hot_applied_seconds = hot_accept_seconds + (time.perf_counter() - started_drain)
+
+        direct = await db.accounts.find_one({"account_number": direct_number})
+        hot = await db.accounts.find_one({"account_number": hot_number})
+        print(f"credits={credits} concurrency={concurrency}")
+        print(f"direct $inc       {credits / direct_seconds:10.0f} credits/sec   balance={direct['balance']}")
+        print(f"hot (accepted)    {credits / hot_accept_seconds:10.0f} credits/sec")
+        print(f"hot (applied)     {credits / hot_applied_seconds:10.0f} credits/sec   balance={hot['balance']}")
+    finally:
+        await db.client.drop_database(HOT_BENCH_DB)
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--credits", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    if HOT_BENCH_DB == APP_MONGO_DB:
+        print(f"HOT_BENCH_DB must not be the application database ({APP_MONGO_DB}); it is dropped afterwards")
+        return 1
+    # app.config reads these at import; values already in the environment
+    # win over the .env file it loads.
+    os.environ["MONGO_URI"] = HOT_BENCH_MONGO_URI
+    os.environ["MONGO_DB"] = HOT_BENCH_DB
+    return asyncio.run(run(args.credits, args.concurrency))
+
+
+if __name__ == "__main__":
+    sys.exit(main())